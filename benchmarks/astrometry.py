@@ -0,0 +1,92 @@
+"""
+Check the interpolated plate-to-sky grid (Astrometry.gridPlateToSky) against
+  the exact transformation (plateToSky) for fields where RA/Dec are awkward
+  to interpolate: one straddling RA=0h and one close to the celestial pole,
+  as well as an ordinary field, eg.,
+
+    python benchmarks/astrometry.py --check
+
+  prints the largest error (in arcseconds) over random plate positions and
+  with --check exits with status 1 if any field exceeds the tolerance.
+"""
+import os,sys,random,shutil,tempfile,argparse
+from math import pi,cos,sin,sqrt
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,os.path.dirname(HERE))
+
+import numpy as np
+from PyQt6.QtCore import QCoreApplication
+
+import synthetic
+from placement import PlacementHost
+
+# name: (RA,Dec) of the field center in degrees
+FIELDS = {"ordinary":(150.,30.),
+          "ra0":(0.05,30.),
+          "pole":(150.,89.8)}
+
+def makeHeader(name,ra,dec):
+    return {"FIELDNAME":name,
+            "RA":synthetic.ra2str(ra).replace(' ',':'),
+            "DEC":synthetic.dec2str(dec).replace(' ',':'),
+            "LST":synthetic.ra2str(ra).replace(' ',':')[:5],
+            "EXPTIME":"3600",
+            "WAVELENGTH":"6000",
+            "CABLE":"RED",
+            "OBSDATE":"2025-03-15",
+            "PA":None,"GUIDEWAVELENGTH":None,"MINFOPS":None,"FOPSWEIGHT":None,
+            "BP-RP_MIN":None,"BP-RP_MAX":None,"GAIA_RANGE":None,"PMEPOCH":None}
+
+def separation(ra1,dec1,ra2,dec2):
+    """
+    Angular separation in arcseconds (all angles in degrees).
+    """
+    ra1,dec1,ra2,dec2 = [np.asarray(_)*pi/180 for _ in (ra1,dec1,ra2,dec2)]
+    a = np.sin((dec2-dec1)/2)**2+np.cos(dec1)*np.cos(dec2)*np.sin((ra2-ra1)/2)**2
+    return 2*np.arcsin(np.sqrt(a))*180/pi*3600
+
+def checkField(host,name,ra,dec,npoints,seed):
+    host.processHeader(makeHeader(name,ra,dec))
+    rng = random.Random(seed)
+    plate = host.HydraConfig["PLATE"]
+    x,y = [],[]
+    for _ in range(npoints):
+        r = plate*sqrt(rng.random())
+        t = 2*pi*rng.random()
+        x.append(r*cos(t))
+        y.append(r*sin(t))
+    x = np.array(x)
+    y = np.array(y)
+    exact = host.plateToSky(x,y)
+    grid = host.gridPlateToSky(x,y)
+    return float(np.max(separation(exact[0],exact[1],grid[0],grid[1])))
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the NeWHydra plate-to-sky interpolation grid.")
+    parser.add_argument("--points",type=int,default=20000,help="Plate positions per field (default: %(default)s)")
+    parser.add_argument("--seed",type=int,default=1,help="Random seed (default: %(default)s)")
+    parser.add_argument("--tolerance",type=float,default=0.5,help="Largest allowed error in arcseconds (default: %(default)s)")
+    parser.add_argument("--check",action="store_true",help="Exit with status 1 if any field exceeds the tolerance")
+    args = parser.parse_args()
+
+    app = QCoreApplication(sys.argv[:1])
+    workdir = tempfile.mkdtemp(prefix="newhydra-benchmark-")
+    failed = False
+    try:
+        host = PlacementHost(workdir)
+        print("{:10s} {:>10s} {:>8s} {:>10s}".format("field","RA","Dec","max error"))
+        for name,(ra,dec) in FIELDS.items():
+            error = checkField(host,name,ra,dec,args.points,args.seed)
+            flag = ""
+            if error>args.tolerance:
+                failed = True
+                flag = " FAILED"
+            print("{:10s} {:10.3f} {:8.3f} {:9.3f}\"{}".format(name,ra,dec,error,flag))
+    finally:
+        shutil.rmtree(workdir,ignore_errors=True)
+    if args.check and failed:
+        sys.exit(1)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Offscreen benchmarks of the fiber display.
+
+The display is built from the packaged hydraConcentricities.json in a
+  NeWHydra window on the offscreen Qt platform (no display is needed), and
+  for synthetic catalogs of increasing size we time:
+
+    fibers   creating all of the fibers (FiberDisplayManager.createFibers)
+    targets  creating the target markers (updateTargets)
+    place    moving half of the fibers off their park positions (updateFibers)
+    redraw   full redraws of the view
+    drag     dragging a fiber button, ie the setFiber() calls made by
+             Button.mouseMoveEvent, each followed by a redraw
+    toggle   showing/hiding the target markers, each followed by a redraw
+
+  eg.,
+
+    python benchmarks/display.py --sizes 100,1000,5000 --output display.json
+
+  Times are reported in milliseconds per frame (or per call).
+"""
+import os,sys,json,time,random,tempfile,argparse
+from math import pi,cos,sin
+from statistics import mean,median
+
+os.environ.setdefault("QT_QPA_PLATFORM","offscreen")
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,os.path.dirname(HERE))
+
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtGui import QImage,QPainter
+from PyQt6.QtCore import QPointF
+
+def makeWindow():
+    """
+    A NeWHydra window that uses the packaged concentricities file: the
+      cache directory is a new temporary directory, and the concentricities
+      are not refreshed from WIYN.
+    """
+    import newhydra.main
+    cachedir = tempfile.mkdtemp(prefix="newhydra-benchmark-")
+    newhydra.main.user_cache_dir = lambda name: cachedir
+    newhydra.main.Window.prompt = lambda self: None
+    newhydra.main.Window.refreshConcentricities = lambda self: None
+    win = newhydra.main.Window()
+    win.show()
+    QApplication.processEvents()
+    return win
+
+def makeTargets(N,plate,seed=1):
+    """
+    N targets spread uniformly over the plate; 10% are FOPS and 10% skies.
+    """
+    rng = random.Random(seed)
+    targets = {}
+    for objid in range(1,N+1):
+        r = plate*0.95*rng.random()**0.5
+        t = 2*pi*rng.random()
+        u = rng.random()
+        objType = 'F' if u<0.1 else 'S' if u<0.2 else 'P'
+        targets[objid] = {"type":objType,
+                          "x":r*cos(t),
+                          "y":r*sin(t),
+                          "fibid":None,
+                          "name":"target%d"%(objid)}
+    return targets
+
+def placeFibers(win,fraction=0.5,seed=1):
+    """
+    Move a fraction of the fibers to random (reachable) positions.
+    """
+    rng = random.Random(seed)
+    plate = win.HydraConfig["PLATE"]
+    bend = win.HydraConfig["MAXANGLE"]
+    FiberDB = {}
+    for fibid,data in win.FiberDB.items():
+        data = dict(data)
+        if rng.random()<fraction:
+            r = plate*(0.2+0.75*rng.random())
+            # Deflect by up to half of the maximum bend seen from the pivot
+            angle = data["theta"]+rng.uniform(-0.5,0.5)*bend*win.HydraConfig["PIVOT"]/(win.HydraConfig["PIVOT"]+r)
+            data.update({"x":r*cos(angle),"y":r*sin(angle),"active":True,"parked":False})
+        FiberDB[fibid] = data
+    return FiberDB
+
+def render(view,image):
+    painter = QPainter(image)
+    view.render(painter)
+    painter.end()
+
+def timeit(func,nrepeat=1):
+    times = []
+    for _ in range(nrepeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter()-start)*1000)
+    return times
+
+def stats(times):
+    times = sorted(times)
+    return {"n":len(times),
+            "mean":mean(times),
+            "median":median(times),
+            "p95":times[min(len(times)-1,int(0.95*len(times)))],
+            "max":times[-1]}
+
+def benchmarkSize(win,N,nframes,seed):
+    from newhydra.fiberdisplay import FiberDisplayScene
+    manager = win.DisplayManager
+    view = win.fiberdisplay
+    size = view.viewport().size()
+    image = QImage(size,QImage.Format.Format_ARGB32_Premultiplied)
+    results = {}
+
+    # Create the fibers in new scenes, then go back to the real scene
+    scene = manager.fiberScene
+    fibers = manager.Fibers
+    def createFibers():
+        manager.fiberScene = FiberDisplayScene(scene.width(),scene.height(),manager)
+        manager.Fibers = {}
+        manager.legalityTree = None
+        manager.fiberGeometries = {}
+        manager.createFibers(win.FiberDB)
+    results["fibers"] = stats(timeit(createFibers,3))
+    manager.fiberScene = scene
+    manager.Fibers = fibers
+    manager.legalityTree = None
+    manager.fiberGeometries = {}
+
+    # Start from a clean catalog
+    manager.TargetDB = {}
+    manager.updateTargets()
+    targets = makeTargets(N,win.HydraConfig["PLATE"],seed)
+    def createTargets():
+        manager.TargetDB = targets
+        manager.updateTargets()
+    results["targets"] = stats(timeit(createTargets))
+
+    # Place half of the fibers and then park them again
+    placed = placeFibers(win,0.5,seed)
+    def place():
+        manager.FiberDB = placed
+        manager.updateFibers()
+    results["place"] = stats(timeit(place))
+
+    results["redraw"] = stats(timeit(lambda: render(view,image),nframes))
+
+    # Drag a placed fiber back and forth along its radial line
+    fiber = [manager.Fibers[int(fibid)] for fibid,data in placed.items() if not data["parked"]][0]
+    x0,y0 = fiber.x,fiber.y
+    dx = (fiber.xpivot-x0)/nframes/2
+    dy = (fiber.ypivot-y0)/nframes/2
+    def drag(i):
+        step = i if i<nframes/2 else nframes-i
+        P = QPointF(x0+dx*step,y0+dy*step)
+        fiber.plotButton.setPos(P)
+        fiber.setFiber(P)
+        render(view,image)
+    results["drag"] = stats([timeit(lambda: drag(i))[0] for i in range(nframes)])
+    fiber.plotButton.setPos(x0,y0)
+    fiber.setFiber()
+
+    cbox = win.showtargets_cbox
+    def toggle():
+        cbox.setChecked(not cbox.isChecked())
+        render(view,image)
+    results["toggle"] = stats(timeit(toggle,nframes))
+    cbox.setChecked(True)
+
+    manager.FiberDB = win.FiberDB
+    manager.updateFibers()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the NeWHydra fiber display offscreen.")
+    parser.add_argument("--sizes",default="100,500,2000,5000",help="Catalog sizes (default: %(default)s)")
+    parser.add_argument("--frames",type=int,default=50,help="Frames per redraw/drag/toggle test (default: %(default)s)")
+    parser.add_argument("--seed",type=int,default=1,help="Random seed (default: %(default)s)")
+    parser.add_argument("--fast",action="store_true",help="Use fast rendering (see FiberDisplayManager.setFastRendering)")
+    parser.add_argument("--output",default=None,help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv[:1])
+    win = makeWindow()
+    win.DisplayManager.setFastRendering(args.fast)
+
+    results = {"date":time.strftime("%Y-%m-%d %H:%M:%S"),
+               "python":sys.version.split()[0],
+               "platform":sys.platform,
+               "fast":args.fast,
+               "frames":args.frames,
+               "sizes":{}}
+    print("{:>6s} {:8s} {:>9s} {:>9s} {:>9s} {:>9s}".format("N","test","mean","median","p95","max"))
+    for N in [int(_) for _ in args.sizes.split(',')]:
+        result = benchmarkSize(win,N,args.frames,args.seed)
+        results["sizes"][N] = result
+        for test,S in result.items():
+            print("{:6d} {:8s} {:7.2f}ms {:7.2f}ms {:7.2f}ms {:7.2f}ms".format(N,test,S["mean"],S["median"],S["p95"],S["max"]))
+    if args.output is not None:
+        with open(args.output,'w') as F:
+            json.dump(results,F,indent=1)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Benchmarks of the fiber placement pipeline.
+
+Synthetic fields (see synthetic.py) are loaded without any Qt widgets or
+  network access: the catalog, astrometry, collision matrix and placement
+  mixins are run on a bare QObject using the packaged hydraConfig.json and
+  hydraConcentricities.json and a synthetic local Gaia catalog. For each
+  field we time
+
+    processTargetFile  loading the field, including the matrix
+    skyToPlate         all calls to skyToPlate while loading the field
+    prepPlacement      fiber geometries for every fiber/target pair
+    createMatrix       the collision matrix (including prepPlacement)
+    doOptimize         the annealing optimizer
+
+  The results are appended to a JSON history (placement_history.jsonl) and
+  compared with earlier entries, eg.,
+
+    python benchmarks/placement.py --fields uniform,dense --check
+"""
+import os,sys,json,time,random,shutil,tempfile,argparse
+from statistics import median
+from contextlib import contextmanager
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,os.path.dirname(HERE))
+
+from PyQt6.QtCore import QObject,QCoreApplication,QThreadPool
+
+from newhydra.main import Window
+from newhydra.inputcatalog import CatalogManager
+from newhydra.astrometry import Astrometry
+from newhydra.collision import CollisionMatrix
+from newhydra.fiberinitializer import FiberInitializer
+from newhydra.configuration import Configuration,ConfigLists
+from newhydra.placer import FiberPlacer
+
+import synthetic
+from startup import gitCommit,readHistory,checkRegression
+
+HISTORY = os.path.join(HERE,"placement_history.jsonl")
+
+FIELDS = {"uniform":{},
+          "small":{"ntargets":100},
+          "large":{"ntargets":2000},
+          "dense":{"radius":0.15},
+          "clustered":{"distribution":"clustered"},
+          "fops":{"nfops":500},
+          "allfibers":{"fibers":"all"},
+          "alternate":{"fibers":"alternate"},
+          "random":{"fibers":"random"}}
+
+
+class PlacementHost(QObject,CatalogManager,Astrometry,CollisionMatrix,FiberInitializer,Configuration,FiberPlacer):
+    """
+    The non-GUI parts of the NeWHydra window. Stages are timed by wrapping
+      the methods that implement them.
+    """
+    str2deg = Window.str2deg
+    ra2str = Window.ra2str
+    dec2str = Window.dec2str
+    roundCoords = Window.roundCoords
+    writeStartupProfile = Window.writeStartupProfile
+    reportProfile = Window.reportProfile
+
+    def __init__(self,workdir,verbose=False):
+        super().__init__()
+        try:
+            from importlib_resources import files
+        except ImportError:
+            from importlib.resources import files
+        self.verbose = verbose
+        self.threadPool = QThreadPool()
+        self.cachedir = os.path.join(workdir,"cache")
+        self.gaiadir = os.path.join(workdir,"gaia")
+        os.makedirs(self.cachedir,exist_ok=True)
+        self.imageService = None
+        self.catalog = None
+        self.HydraConfig = eval(files("newhydra").joinpath("data/hydraConfig.json").read_text())
+        self.sitePars = self.HydraConfig["WIYN"]
+        self.setButtons()
+        self.processConcentricityFile(files("newhydra").joinpath("data/hydraConcentricities.json").read_text())
+        self.printMessageSignal.connect(self.printMessage)
+        self.times = {}
+
+    @contextmanager
+    def timer(self,stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[stage] = self.times.get(stage,0.)+time.perf_counter()-start
+
+    def printMessage(self,*kargs):
+        if self.verbose:
+            print(" ".join(kargs))
+
+    def printError(self,*kargs):
+        print(" ".join(kargs))
+
+    # There is no display, progress window or Pan-STARRS image
+    def setImage(self):
+        pass
+
+    def setMatrix(self):
+        self.createMatrix()
+
+    def zeroCurrentConfig(self):
+        self.currentConfig = ConfigLists()
+
+    def processTargetFile(self,filename):
+        with self.timer("processTargetFile"):
+            CatalogManager.processTargetFile(self,filename)
+        self.threadPool.waitForDone()
+
+    def skyToPlate(self,inRA,inDec):
+        with self.timer("skyToPlate"):
+            return Astrometry.skyToPlate(self,inRA,inDec)
+
+    def prepPlacement(self):
+        with self.timer("prepPlacement"):
+            CollisionMatrix.prepPlacement(self)
+
+    def createMatrix(self):
+        with self.timer("createMatrix"):
+            CollisionMatrix.createMatrix(self)
+
+    def doOptimize(self,nsteps=20000):
+        with self.timer("doOptimize"):
+            FiberPlacer.doOptimize(self,nsteps)
+
+
+def runField(name,field,nsteps,verbose=False):
+    """
+    Load a synthetic field in a new host and return the stage times and a
+      few properties of the result.
+    """
+    workdir = tempfile.mkdtemp(prefix="newhydra-benchmark-")
+    try:
+        filename = os.path.join(workdir,name+".hydra")
+        synthetic.writeField(filename,field)
+        host = PlacementHost(workdir,verbose)
+        synthetic.writeGaiaCatalog(host.gaiadir,field)
+        synthetic.setFiberPattern(host.FiberDB,field)
+        host.processTargetFile(filename)
+        if not host.catalog:
+            raise RuntimeError("Could not load the synthetic field "+name)
+        random.seed(field["seed"])
+        host.doOptimize(nsteps)
+        return {"times":host.times,
+                "ntargets":len(host.catalog),
+                "nfibers":len(host.fibers),
+                "nfops":len(host.FOPSindex),
+                "score":host.currentConfig.score}
+    finally:
+        shutil.rmtree(workdir,ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the NeWHydra fiber placement pipeline.")
+    parser.add_argument("--fields",default=",".join(FIELDS),help="Synthetic fields to run (default: %(default)s)")
+    parser.add_argument("--steps",type=int,default=2000,help="Optimizer steps (default: %(default)s)")
+    parser.add_argument("--runs",type=int,default=3,help="Runs per field (default: %(default)s)")
+    parser.add_argument("--seed",type=int,default=1,help="Random seed (default: %(default)s)")
+    parser.add_argument("--history",default=HISTORY,help="History file (default: %(default)s)")
+    parser.add_argument("--no-save",action="store_true",help="Don't append the results to the history")
+    parser.add_argument("--check",action="store_true",help="Exit with status 1 if any stage has regressed")
+    parser.add_argument("--tolerance",type=float,default=0.25,help="Allowed fractional slowdown (default: %(default)s)")
+    parser.add_argument("--slack",type=float,default=0.05,help="Allowed absolute slowdown in seconds (default: %(default)s)")
+    parser.add_argument("--verbose",action="store_true",help="Show NeWHydra messages")
+    args = parser.parse_args()
+
+    app = QCoreApplication(sys.argv[:1])
+    entry = {"date":time.strftime("%Y-%m-%d %H:%M:%S"),
+             "version":None,
+             "commit":gitCommit(),
+             "python":sys.version.split()[0],
+             "platform":sys.platform,
+             "runs":args.runs,
+             "steps":args.steps,
+             "fields":{},
+             "phases":{}}
+    try:
+        from importlib.metadata import version
+        entry["version"] = version("newhydra")
+    except:
+        pass
+
+    print("{:10s} {:>6s} {:>6s} {:>5s} {:>18s} {:>10s} {:>13s} {:>12s} {:>10s}".format("field","ntarg","nfib","nfops","processTargetFile","skyToPlate","prepPlacement","createMatrix","doOptimize"))
+    stages = ["processTargetFile","skyToPlate","prepPlacement","createMatrix","doOptimize"]
+    for name in args.fields.split(','):
+        field = synthetic.makeField(name=name,seed=args.seed,**FIELDS[name])
+        results = [runField(name,field,args.steps,args.verbose) for _ in range(args.runs)]
+        times = {stage:median(_["times"].get(stage,0.) for _ in results) for stage in stages}
+        result = dict(results[0])
+        result["times"] = times
+        entry["fields"][name] = result
+        # Flattened for the regression check shared with startup.py
+        for stage,t in times.items():
+            entry["phases"][name+"/"+stage] = t
+        print("{:10s} {:6d} {:6d} {:5d} {:17.3f}s {:9.3f}s {:12.3f}s {:11.3f}s {:9.3f}s".format(name,result["ntargets"],result["nfibers"],result["nfops"],*[times[_] for _ in stages]))
+
+    # The optimizer time depends on the number of steps
+    history = [_ for _ in readHistory(args.history) if _["steps"]==args.steps]
+    regressions = checkRegression(entry,history,args.tolerance,args.slack)
+    for name,t,reference in regressions:
+        print("REGRESSION: {} took {:.3f}s (previously {:.3f}s)".format(name,t,reference))
+    if not args.no_save:
+        with open(args.history,'a') as F:
+            F.write(json.dumps(entry)+"\n")
+    if args.check and len(regressions)>0:
+        sys.exit(1)
+
+if __name__=="__main__":
+    main()
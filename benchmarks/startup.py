@@ -0,0 +1,161 @@
+"""
+Track NeWHydra startup times between releases.
+
+Each run starts NeWHydra in a fresh (offscreen) interpreter with startup
+  profiling switched on (see newhydra/startup.py), optionally loads a field
+  file, and collects the JSON profile. The median of several runs is
+  appended to a history file so that startup regressions can be caught,
+  eg.,
+
+    python benchmarks/startup.py --field myfield.hydra --check
+
+  exits with status 1 if any phase is slower than the previous entries in
+  the history by more than the tolerance.
+"""
+import os,sys,json,time,subprocess,tempfile,argparse
+from statistics import median
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+HISTORY = os.path.join(HERE,"startup_history.jsonl")
+
+# Run inside the child interpreter: the profile is written by the Window
+#  once it is up and again after the field has been loaded
+DRIVER = """
+import sys,os
+from PyQt6.QtWidgets import QApplication
+app = QApplication(sys.argv[:1])
+import newhydra.main
+newhydra.main.Window.prompt = lambda self: None
+win = newhydra.main.Window()
+win.show()
+app.processEvents()
+if os.environ.get("BENCHMARK_GAIADIR"):
+    win.gaiadir = os.environ["BENCHMARK_GAIADIR"]
+if os.environ.get("BENCHMARK_FIELD"):
+    win.processTargetFile(os.environ["BENCHMARK_FIELD"])
+win.threadPool.waitForDone()
+"""
+
+def runOnce(field=None,gaiadir=None):
+    """
+    Start NeWHydra in a new interpreter and return its startup profile,
+      with the wall time of the whole process added as the `process' phase.
+    """
+    fd,profile = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    env = dict(os.environ)
+    env["NEWHYDRA_PROFILE_STARTUP"] = profile
+    env.setdefault("QT_QPA_PLATFORM","offscreen")
+    # Benchmark this checkout rather than any installed copy
+    env["PYTHONPATH"] = os.pathsep.join([ROOT]+[_ for _ in [env.get("PYTHONPATH")] if _])
+    if field is not None:
+        env["BENCHMARK_FIELD"] = os.path.abspath(field)
+    if gaiadir is not None:
+        env["BENCHMARK_GAIADIR"] = os.path.abspath(gaiadir)
+    try:
+        start = time.perf_counter()
+        subprocess.run([sys.executable,"-c",DRIVER],env=env,check=True,
+                       stdout=subprocess.DEVNULL)
+        elapsed = time.perf_counter()-start
+        with open(profile) as F:
+            result = json.load(F)
+    finally:
+        os.remove(profile)
+    result["phases"]["process"] = elapsed
+    return result
+
+def gitCommit():
+    try:
+        return subprocess.run(["git","rev-parse","--short","HEAD"],cwd=HERE,
+                              capture_output=True,text=True).stdout.strip() or None
+    except:
+        return None
+
+def summarize(results,ntop):
+    """
+    Median phase and import times over the runs.
+    """
+    phases = {}
+    for name in results[0]["phases"]:
+        phases[name] = median(_["phases"].get(name,0.) for _ in results)
+    imports = {}
+    for result in results:
+        for entry in result["imports"]:
+            imports.setdefault(entry["module"],[]).append(entry["cumulative"])
+    imports = {name:median(times) for name,times in imports.items()}
+    top = sorted(imports.items(),key=lambda _:_[1],reverse=True)[:ntop]
+    return {"date":time.strftime("%Y-%m-%d %H:%M:%S"),
+            "version":results[0]["version"],
+            "commit":gitCommit(),
+            "python":results[0]["python"],
+            "platform":results[0]["platform"],
+            "runs":len(results),
+            "imports_total":median(_["imports_total"] for _ in results),
+            "phases":phases,
+            "top_imports":dict(top)}
+
+def readHistory(filename):
+    history = []
+    if os.path.isfile(filename):
+        with open(filename) as F:
+            for line in F:
+                if line.strip():
+                    history.append(json.loads(line))
+    return history
+
+def checkRegression(entry,history,tolerance,slack,nprevious=5):
+    """
+    Compare each phase with the median of the last few history entries from
+      the same platform and Python version; return the regressed phases.
+    """
+    history = [_ for _ in history if _["platform"]==entry["platform"] and _["python"]==entry["python"]][-nprevious:]
+    regressions = []
+    if len(history)==0:
+        return regressions
+    for name,t in entry["phases"].items():
+        previous = [_["phases"][name] for _ in history if name in _["phases"]]
+        if len(previous)==0:
+            continue
+        reference = median(previous)
+        if t>reference*(1+tolerance)+slack:
+            regressions.append((name,t,reference))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure NeWHydra startup times.")
+    parser.add_argument("--field",default=None,help="Hydra field file to load after startup")
+    parser.add_argument("--gaia-dir",default=None,help="Local Gaia catalog directory to use for the field")
+    parser.add_argument("--runs",type=int,default=5,help="Number of runs (default: 5)")
+    parser.add_argument("--history",default=HISTORY,help="History file (default: %(default)s)")
+    parser.add_argument("--no-save",action="store_true",help="Don't append the results to the history")
+    parser.add_argument("--check",action="store_true",help="Exit with status 1 if startup has regressed")
+    parser.add_argument("--tolerance",type=float,default=0.25,help="Allowed fractional slowdown (default: 0.25)")
+    parser.add_argument("--slack",type=float,default=0.05,help="Allowed absolute slowdown in seconds (default: 0.05)")
+    parser.add_argument("--top",type=int,default=15,help="Number of slowest imports to report (default: 15)")
+    args = parser.parse_args()
+
+    # The first run warms the filesystem cache and isn't counted
+    runOnce(args.field,args.gaia_dir)
+    results = [runOnce(args.field,args.gaia_dir) for _ in range(args.runs)]
+    entry = summarize(results,args.top)
+
+    print("Startup phases (median of {} runs):".format(args.runs))
+    for name,t in entry["phases"].items():
+        print("  {:16s} {:7.3f}s".format(name,t))
+    print("Slowest imports (cumulative):")
+    for name,t in entry["top_imports"].items():
+        print("  {:40s} {:7.3f}s".format(name,t))
+
+    history = readHistory(args.history)
+    regressions = checkRegression(entry,history,args.tolerance,args.slack)
+    for name,t,reference in regressions:
+        print("REGRESSION: {} took {:.3f}s (previously {:.3f}s)".format(name,t,reference))
+    if not args.no_save:
+        with open(args.history,'a') as F:
+            F.write(json.dumps(entry)+"\n")
+    if args.check and len(regressions)>0:
+        sys.exit(1)
+
+if __name__=="__main__":
+    main()
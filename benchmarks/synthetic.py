@@ -0,0 +1,158 @@
+"""
+Synthetic Hydra fields for benchmarking.
+
+A field is described by a dictionary (see FIELD) of:
+
+    ntargets      number of targets in the field file
+    radius        radius (degrees) over which targets are spread; a smaller
+                  radius gives a denser field
+    distribution  `uniform', or `clustered' in nclusters Gaussian clumps
+                  of width clusterSize (degrees)
+    nfops         number of Gaia stars with 10<G<12 in the synthetic local
+                  Gaia catalog (there are three times as many with 12<G<14)
+    fibers        active fiber pattern: `cable' uses the packaged
+                  concentricities, `all' puts every red/blue fiber on the
+                  field cable, `alternate' breaks every other fiber, and
+                  `random' breaks fibers at random, keeping activeFraction
+    seed          random seed; the same description always gives the same
+                  field
+
+The field file and Gaia catalog only depend on the description, so no
+  network access is needed to load them.
+"""
+import random
+from math import pi,cos,sin,sqrt
+
+FIELD = {"name":"uniform",
+         "ntargets":500,
+         "radius":0.45,
+         "distribution":"uniform",
+         "nclusters":5,
+         "clusterSize":0.05,
+         "nfops":150,
+         "fibers":"cable",
+         "activeFraction":0.7,
+         "cable":"RED",
+         "seed":1}
+
+FIELDRA = 150.
+FIELDDEC = 30.
+
+def makeField(**kargs):
+    field = dict(FIELD)
+    field.update(kargs)
+    return field
+
+def ra2str(ra):
+    ms = int(round(ra/15*3600*1000))
+    h,ms = divmod(ms,3600000)
+    m,ms = divmod(ms,60000)
+    return "%02d %02d %06.3f"%(h,m,ms/1000)
+
+def dec2str(dec):
+    sign = "+" if dec>=0 else "-"
+    cs = int(round(abs(dec)*360000))
+    d,cs = divmod(cs,360000)
+    m,cs = divmod(cs,6000)
+    return "%s%02d %02d %05.2f"%(sign,d,m,cs/100)
+
+def offsetPosition(rng,field):
+    """
+    A random offset (degrees) from the field center.
+    """
+    radius = field["radius"]
+    while True:
+        if field["distribution"]=="clustered":
+            cx,cy = field["centers"][rng.randrange(len(field["centers"]))]
+            dx = rng.gauss(cx,field["clusterSize"])
+            dy = rng.gauss(cy,field["clusterSize"])
+        else:
+            r = radius*sqrt(rng.random())
+            t = 2*pi*rng.random()
+            dx,dy = r*cos(t),r*sin(t)
+        if dx*dx+dy*dy<radius*radius:
+            return dx,dy
+
+def makeTargets(field):
+    """
+    Return a list of (ra,dec,mag,weight) for the field targets.
+    """
+    rng = random.Random(field["seed"])
+    field = dict(field)
+    centers = []
+    for _ in range(field["nclusters"]):
+        r = field["radius"]*0.8*sqrt(rng.random())
+        t = 2*pi*rng.random()
+        centers.append((r*cos(t),r*sin(t)))
+    field["centers"] = centers
+    targets = []
+    for _ in range(field["ntargets"]):
+        dx,dy = offsetPosition(rng,field)
+        dec = FIELDDEC+dy
+        ra = FIELDRA+dx/cos(dec*pi/180)
+        targets.append((ra,dec,15+3*rng.random(),rng.randint(1,100)))
+    return targets
+
+def writeField(filename,field):
+    lines = ["FIELDNAME: "+field["name"],
+             "RA: "+ra2str(FIELDRA).replace(' ',':'),
+             "DEC: "+dec2str(FIELDDEC).replace(' ',':'),
+             "LST: 10:00",
+             "EXPTIME: 3600",
+             "WAVELENGTH: 6000",
+             "CABLE: "+field["cable"],
+             "OBSDATE: 2025-03-15"]
+    for objid,(ra,dec,mag,weight) in enumerate(makeTargets(field)):
+        lines.append("{:4d} {:30s} {:5.2f} {:12s} {:12s} {:5d}".format(objid+1,"target%d"%(objid+1),mag,ra2str(ra),dec2str(dec),weight))
+    with open(filename,'w') as F:
+        F.write("\n".join(lines)+"\n")
+
+def makeGaiaStars(field):
+    import numpy as np
+    from newhydra.gaiacatalog import GAIA_DTYPE
+    rng = random.Random(field["seed"]+1)
+    N = 4*field["nfops"]
+    stars = np.zeros(N,GAIA_DTYPE)
+    for i in range(N):
+        r = 0.5*sqrt(rng.random())
+        t = 2*pi*rng.random()
+        dec = FIELDDEC+r*sin(t)
+        stars[i] = (i+1,
+                    FIELDRA+r*cos(t)/cos(dec*pi/180),
+                    dec,
+                    rng.gauss(0,5),
+                    rng.gauss(0,5),
+                    10+2*rng.random() if i<field["nfops"] else 12+2*rng.random(),
+                    0.5+rng.random())
+    return stars[np.argsort(stars["ra"])]
+
+def writeGaiaCatalog(directory,field):
+    """
+    Write a local Gaia catalog covering the field.
+    """
+    from newhydra.gaiacatalog import LocalGaiaCatalog
+    catalog = LocalGaiaCatalog(directory)
+    catalog.addRegion(FIELDRA,FIELDDEC,1.,makeGaiaStars(field))
+
+def setFiberPattern(FiberDB,field):
+    """
+    Set the fiber status in a fiber database for the active fiber pattern;
+      processHeader() then activates the usable fibers of the field cable.
+    """
+    pattern = field["fibers"]
+    if pattern=="cable":
+        return
+    rng = random.Random(field["seed"]+2)
+    cable = field["cable"][0]
+    for fibid,data in FiberDB.items():
+        if data["cable"] not in ('R','B'):
+            continue
+        if pattern=="all":
+            data["cable"] = cable
+            data["status"] = 'A'
+        elif pattern=="alternate":
+            data["status"] = 'A' if int(fibid)%2==0 else 'B'
+        elif pattern=="random":
+            data["status"] = 'A' if rng.random()<field["activeFraction"] else 'B'
+        else:
+            raise ValueError("Unknown fiber pattern: "+pattern)
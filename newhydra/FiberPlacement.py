@@ -26,10 +26,10 @@ class Ui_MainWindow(object):
         self.centralwidget = QtWidgets.QWidget(parent=MainWindow)
         self.centralwidget.setObjectName("centralwidget")
         self.coords = QtWidgets.QWidget(parent=self.centralwidget)
-        self.coords.setGeometry(QtCore.QRect(582, 626, 51, 44))
+        self.coords.setGeometry(QtCore.QRect(537, 582, 96, 88))
         self.coords.setObjectName("coords")
         self.layoutWidget_5 = QtWidgets.QWidget(parent=self.coords)
-        self.layoutWidget_5.setGeometry(QtCore.QRect(0, 0, 51, 44))
+        self.layoutWidget_5.setGeometry(QtCore.QRect(0, 0, 96, 88))
         self.layoutWidget_5.setObjectName("layoutWidget_5")
         self.verticalLayout = QtWidgets.QVBoxLayout(self.layoutWidget_5)
         self.verticalLayout.setSizeConstraint(QtWidgets.QLayout.SizeConstraint.SetMinimumSize)
@@ -43,6 +43,14 @@ class Ui_MainWindow(object):
         self.ycoord_label.setScaledContents(False)
         self.ycoord_label.setObjectName("ycoord_label")
         self.verticalLayout.addWidget(self.ycoord_label)
+        self.racoord_label = QtWidgets.QLabel(parent=self.layoutWidget_5)
+        self.racoord_label.setIndent(3)
+        self.racoord_label.setObjectName("racoord_label")
+        self.verticalLayout.addWidget(self.racoord_label)
+        self.deccoord_label = QtWidgets.QLabel(parent=self.layoutWidget_5)
+        self.deccoord_label.setIndent(3)
+        self.deccoord_label.setObjectName("deccoord_label")
+        self.verticalLayout.addWidget(self.deccoord_label)
         self.fieldinfo = QtWidgets.QWidget(parent=self.centralwidget)
         self.fieldinfo.setGeometry(QtCore.QRect(11, 61, 121, 63))
         self.fieldinfo.setObjectName("fieldinfo")
@@ -82,46 +90,9 @@ class Ui_MainWindow(object):
         self.fiberdisplay.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
         self.fiberdisplay.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
         self.fiberdisplay.setObjectName("fiberdisplay")
-        self.FiberTable = QtWidgets.QTableWidget(parent=self.centralwidget)
+        self.FiberTable = QtWidgets.QTableView(parent=self.centralwidget)
         self.FiberTable.setGeometry(QtCore.QRect(645, 5, 625, 571))
-        self.FiberTable.setRowCount(99)
         self.FiberTable.setObjectName("FiberTable")
-        self.FiberTable.setColumnCount(7)
-        item = QtWidgets.QTableWidgetItem()
-        font = QtGui.QFont()
-        font.setPointSize(10)
-        item.setFont(font)
-        self.FiberTable.setHorizontalHeaderItem(0, item)
-        item = QtWidgets.QTableWidgetItem()
-        font = QtGui.QFont()
-        font.setPointSize(10)
-        item.setFont(font)
-        self.FiberTable.setHorizontalHeaderItem(1, item)
-        item = QtWidgets.QTableWidgetItem()
-        font = QtGui.QFont()
-        font.setPointSize(10)
-        item.setFont(font)
-        self.FiberTable.setHorizontalHeaderItem(2, item)
-        item = QtWidgets.QTableWidgetItem()
-        font = QtGui.QFont()
-        font.setPointSize(10)
-        item.setFont(font)
-        self.FiberTable.setHorizontalHeaderItem(3, item)
-        item = QtWidgets.QTableWidgetItem()
-        font = QtGui.QFont()
-        font.setPointSize(10)
-        item.setFont(font)
-        self.FiberTable.setHorizontalHeaderItem(4, item)
-        item = QtWidgets.QTableWidgetItem()
-        font = QtGui.QFont()
-        font.setPointSize(10)
-        item.setFont(font)
-        self.FiberTable.setHorizontalHeaderItem(5, item)
-        item = QtWidgets.QTableWidgetItem()
-        font = QtGui.QFont()
-        font.setPointSize(10)
-        item.setFont(font)
-        self.FiberTable.setHorizontalHeaderItem(6, item)
         self.FiberTable.horizontalHeader().setMinimumSectionSize(8)
         self.loadField_btn = QtWidgets.QPushButton(parent=self.centralwidget)
         self.loadField_btn.setGeometry(QtCore.QRect(10, 5, 101, 46))
@@ -200,6 +171,9 @@ class Ui_MainWindow(object):
         self.showUnassigned_btn = QtWidgets.QPushButton(parent=self.centralwidget)
         self.showUnassigned_btn.setGeometry(QtCore.QRect(530, 5, 101, 46))
         self.showUnassigned_btn.setObjectName("showUnassigned_btn")
+        self.cable_btn = QtWidgets.QPushButton(parent=self.centralwidget)
+        self.cable_btn.setGeometry(QtCore.QRect(11, 128, 121, 26))
+        self.cable_btn.setObjectName("cable_btn")
         self.messageBox = QtWidgets.QTextEdit(parent=self.centralwidget)
         self.messageBox.setGeometry(QtCore.QRect(645, 579, 625, 91))
         self.messageBox.setReadOnly(True)
@@ -218,6 +192,7 @@ class Ui_MainWindow(object):
         self.makeSkies_btn.raise_()
         self.showUnassigned_btn.raise_()
         self.messageBox.raise_()
+        self.cable_btn.raise_()
         MainWindow.setCentralWidget(self.centralwidget)
 
         self.retranslateUi(MainWindow)
@@ -233,20 +208,6 @@ class Ui_MainWindow(object):
         self.showtargets_cbox.setText(_translate("MainWindow", "Targets"))
         self.showfops_cbox.setText(_translate("MainWindow", "FOPS"))
         self.showskys_cbox.setText(_translate("MainWindow", "Skys"))
-        item = self.FiberTable.horizontalHeaderItem(0)
-        item.setText(_translate("MainWindow", "ID"))
-        item = self.FiberTable.horizontalHeaderItem(1)
-        item.setText(_translate("MainWindow", "Name"))
-        item = self.FiberTable.horizontalHeaderItem(2)
-        item.setText(_translate("MainWindow", "Mag"))
-        item = self.FiberTable.horizontalHeaderItem(3)
-        item.setText(_translate("MainWindow", "RA"))
-        item = self.FiberTable.horizontalHeaderItem(4)
-        item.setText(_translate("MainWindow", "Dec"))
-        item = self.FiberTable.horizontalHeaderItem(5)
-        item.setText(_translate("MainWindow", "Fib"))
-        item = self.FiberTable.horizontalHeaderItem(6)
-        item.setText(_translate("MainWindow", "Slit"))
         self.loadField_btn.setText(_translate("MainWindow", "Load Field"))
         self.saveConfig_btn.setText(_translate("MainWindow", "Save\n"
 "Configuration"))
@@ -285,4 +246,7 @@ class Ui_MainWindow(object):
 "For Skies"))
         self.showUnassigned_btn.setText(_translate("MainWindow", "Show\n"
 "Unassigned"))
+        self.cable_btn.setToolTip(_translate("MainWindow", "Switch the field to the other cable"))
+        self.cable_btn.setText(_translate("MainWindow", "RED cable"))
+        self.cable_btn.setShortcut(_translate("MainWindow", "Ctrl+B"))
 from .fiberdisplay import FiberDisplayView
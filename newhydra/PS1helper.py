@@ -1,10 +1,10 @@
-import sys,urllib,json
+import sys,os,urllib,json,hashlib,time
 import base64
-import requests
-from PIL import Image
-from math import cos,sin,pi
-from multiprocessing import Pool
+from math import cos,sin,pi,ceil
+from concurrent.futures import ThreadPoolExecutor,as_completed
 from io import BytesIO
+from PyQt6.QtGui import QImage,QPainter
+from PyQt6.QtCore import QRect,QRectF
 
 """
 fname = sys.argv[1]
@@ -18,6 +18,8 @@ mode = int(sys.argv[7])
 
 
 def downloadData(url):
+    import requests
+    from PIL import Image
     try:
         resp = requests.get(url,stream=True)
         response = Image.open(resp.raw)
@@ -71,10 +73,11 @@ def getPS1Image(ra,dec,rot,fov=0.99314,pincushion=77.6,npix=500,mode=0):
                 wcs['CRPIX2'] = crpix2
                 urlList.append(makeURL(wcs))
 
-        with Pool(9) as P:
-            images = P.map(downloadData,urlList)
+        with ThreadPoolExecutor(9) as P:
+            images = list(P.map(downloadData,urlList))
         if None in images:
             return None
+        from PIL import Image
         img = Image.new('RGB',(size*3,size*3))
         imgCount = 0
         for dx in range(3):
@@ -100,6 +103,185 @@ def getPS1Image(ra,dec,rot,fov=0.99314,pincushion=77.6,npix=500,mode=0):
         f.close()
     return image
 
+class PS1ImageService:
+    """
+    Tiled, cached Pan-STARRS images from hips2fits.
+
+    The ZPN projection is centred on a point snapped to a GRID degree grid,
+      so that nearby fields request exactly the same tiles; the field image
+      is then cut out of the tile mosaic. (Within GRID/2 of the field
+      centre the pincushion term changes the image scale by well under a
+      pixel.) Tiles are downloaded concurrently over a pooled session and
+      cached on disk, least-recently-used tiles being removed once the
+      cache is larger than maxCache bytes. A low-resolution image of the
+      whole mosaic is fetched first so that something can be shown at once.
+
+    The hips2fits URL can be replaced (eg, by a local test server) with
+      the NEWHYDRA_HIPS2FITS_URL environment variable.
+    """
+    DEFAULT_URL = "https://alasky.cds.unistra.fr/hips-image-services/hips2fits"
+    HIPS = "CDS/P/PanSTARRS/DR1/color-i-r-g"
+    GRID = 0.04
+    TILESIZE = 1250
+    PREVIEWSIZE = 1000
+    # Minimum time (seconds) between refined images sent to the display
+    REFRESH = 2.
+
+    def __init__(self,cachedir,baseURL=None,nthreads=8,maxCache=500*1024**2,timeout=60):
+        if baseURL is None:
+            baseURL = os.environ.get("NEWHYDRA_HIPS2FITS_URL",self.DEFAULT_URL)
+        self.baseURL = baseURL
+        self.cachedir = cachedir
+        self.nthreads = nthreads
+        self.maxCache = maxCache
+        self.timeout = timeout
+        os.makedirs(cachedir,exist_ok=True)
+        import requests
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,pool_maxsize=nthreads)
+        self.session.mount("http://",adapter)
+        self.session.mount("https://",adapter)
+
+    def makeURL(self,wcs):
+        query = {"hips":self.HIPS,"format":"jpg","min_cut":0,"max_cut":255,"wcs":json.dumps(wcs)}
+        return self.baseURL+"?"+urllib.parse.urlencode(query)
+
+    def makeWCS(self,ra,dec,npix,scale,crpix1,crpix2,pincushion):
+        return {"NAXIS1":npix,
+                "NAXIS2":npix,
+                "WCSAXES":2,
+                "CRPIX1":crpix1,
+                "CRPIX2":crpix2,
+                "CD1_1":-scale,
+                "CD1_2":0.,
+                "CD2_1":0.,
+                "CD2_2":-scale,
+                "CUNIT1":"deg",
+                "CUNIT2":"deg",
+                "CTYPE1":"RA---ZPN",
+                "CTYPE2":"DEC--ZPN",
+                "CRVAL1":ra,
+                "CRVAL2":dec,
+                "PV2_1":1.,
+                "PV2_3":pincushion}
+
+    def getTile(self,url):
+        """
+        Return the tile for url, from the cache or the server, decoded into a
+          QImage (in the calling thread), or None if it could not be
+          downloaded.
+        """
+        filename = os.path.join(self.cachedir,hashlib.md5(url.encode()).hexdigest()+".jpg")
+        if os.path.isfile(filename):
+            img = QImage(filename,"JPG")
+            if not img.isNull():
+                os.utime(filename)
+                return img
+        try:
+            resp = self.session.get(url,timeout=self.timeout)
+            resp.raise_for_status()
+        except:
+            return None
+        img = QImage.fromData(resp.content,"JPG")
+        if img.isNull():
+            return None
+        with open(filename,"wb") as F:
+            F.write(resp.content)
+        return img
+
+    def evict(self):
+        files = []
+        for name in os.listdir(self.cachedir):
+            path = os.path.join(self.cachedir,name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime,stat.st_size,path))
+        total = sum(size for _,size,_ in files)
+        for _,size,path in sorted(files):
+            if total<=self.maxCache:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def getImage(self,ra,dec,callback=None,fov=0.99314,pincushion=77.6,npix=4500):
+        """
+        Return an npix QImage of diameter fov (degrees) centred on ra,dec, or
+          None if nothing could be downloaded. callback(img) is called with
+          the preview, with refined images as tiles arrive, and with the
+          final image. All decoding and compositing happens in the calling
+          thread, so the GUI only has to convert the result to a QPixmap.
+        """
+        scale = fov/npix
+        # Snap the projection centre; RA is snapped in steps of similar size
+        #  on the sky
+        dec0 = round(dec/self.GRID)*self.GRID
+        rastep = self.GRID/max(cos(dec0*pi/180),0.1)
+        ra0 = (round(ra/rastep)*rastep)%360
+
+        # Position of the field centre (in image pixels, y down) relative to
+        #  the projection centre
+        d2r = pi/180
+        cosc = sin(dec0*d2r)*sin(dec*d2r)+cos(dec0*d2r)*cos(dec*d2r)*cos((ra-ra0)*d2r)
+        xi = cos(dec*d2r)*sin((ra-ra0)*d2r)/cosc/d2r
+        eta = (cos(dec0*d2r)*sin(dec*d2r)-sin(dec0*d2r)*cos(dec*d2r)*cos((ra-ra0)*d2r))/cosc/d2r
+        dx,dy = -xi/scale,eta/scale
+
+        # The mosaic must be the same for every field in a grid cell
+        T = self.TILESIZE
+        margin = max(self.GRID/scale,2*abs(dx),2*abs(dy))
+        ntiles = int(ceil((npix+margin)/T))
+        N = ntiles*T
+        x0 = int(round(N/2+dx-npix/2))
+        y0 = int(round(N/2+dy-npix/2))
+        box = QRect(x0,y0,npix,npix)
+
+        P = self.PREVIEWSIZE
+        previewURL = self.makeURL(self.makeWCS(ra0,dec0,P,scale*N/P,P/2,P/2,pincushion))
+        urls = {}
+        for a in range(ntiles):
+            for b in range(ntiles):
+                wcs = self.makeWCS(ra0,dec0,T,scale,N/2-a*T,(b+1)*T-N/2,pincushion)
+                urls[self.makeURL(wcs)] = (a*T,b*T)
+
+        mosaic = QImage(N,N,QImage.Format.Format_RGB32)
+        mosaic.fill(0)
+        preview = self.getTile(previewURL)
+        if preview is not None:
+            painter = QPainter(mosaic)
+            painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+            painter.drawImage(QRectF(0,0,N,N),preview)
+            painter.end()
+            if callback is not None:
+                f = P/N
+                callback(preview.copy(QRect(int(round(x0*f)),int(round(y0*f)),int(round(npix*f)),int(round(npix*f)))))
+        ngood = 0
+        tlast = time.time()
+        with ThreadPoolExecutor(self.nthreads) as pool:
+            futures = {pool.submit(self.getTile,url):url for url in urls}
+            for future in as_completed(futures):
+                tile = future.result()
+                if tile is None:
+                    continue
+                painter = QPainter(mosaic)
+                painter.drawImage(*urls[futures[future]],tile)
+                painter.end()
+                ngood += 1
+                if callback is not None and ngood<len(urls) and time.time()-tlast>self.REFRESH:
+                    tlast = time.time()
+                    callback(mosaic.copy(box))
+        self.evict()
+        if preview is None and ngood==0:
+            return None
+        img = mosaic.copy(box)
+        if callback is not None and ngood>0:
+            callback(img)
+        return img
+
 def getObjects(ra,dec,radius=1.,glimit=22,rlimit=22):
     from astroquery.mast import Catalogs
     coords = "{} {}".format(ra,dec)
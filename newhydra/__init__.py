@@ -0,0 +1,5 @@
+import os,sys
+# Startup profiling has to be switched on before anything else is imported
+if os.environ.get("NEWHYDRA_PROFILE_STARTUP") is not None or any(arg.startswith("--profile-startup") for arg in sys.argv[1:]):
+    from . import startup
+    startup.enable()
@@ -1,5 +1,7 @@
 from math import pi,sin,cos,acos,asin,tan,atan2,sqrt,exp
 import time
+import numpy as np
+from .profiling import profiled
 
 def DEG2RAD(deg):
     return deg*pi/180
@@ -9,6 +11,7 @@ def RAD2DEG(rad):
 
 class Astrometry:
     A,B,guideA,guideB = 0.,0.,0.,0.
+    skyGrid = None
     def setABCoefficients(self,temp=20):
         wavelength = self.WAVELENGTH/10000.
         guideWave = self.GUIDEWAVELENGTH/10000.
@@ -26,20 +29,20 @@ class Astrometry:
         cosLat = cos(latitude)
         sinLat = sin(latitude)
 
-        cos_zdist = sin(dec)*sinLat+cos(dec)*cosLat*cos(hourAngle)
+        cos_zdist = np.sin(dec)*sinLat+np.cos(dec)*cosLat*np.cos(hourAngle)
         airmass = 1./cos_zdist
-        zdist = acos(cos_zdist)
+        zdist = np.arccos(cos_zdist)
 
         z_refract = refz(zdist,A,B)
-        az = atan2(sin(hourAngle),cos(hourAngle)*sinLat-tan(dec)*cosLat)
+        az = np.arctan2(np.sin(hourAngle),np.cos(hourAngle)*sinLat-np.tan(dec)*cosLat)
         az += pi
 
-        newDec = asin(sinLat*cos(z_refract)+cosLat*sin(z_refract)*cos(az))
+        newDec = np.arcsin(sinLat*np.cos(z_refract)+cosLat*np.sin(z_refract)*np.cos(az))
         dDec = newDec-dec
 
-        sinHa = -sin(az)*sin(z_refract)
-        cosHa = (cos(z_refract)-sin(newDec)*sinLat)/cosLat
-        newHa = atan2(sinHa,cosHa)
+        sinHa = -np.sin(az)*np.sin(z_refract)
+        cosHa = (np.cos(z_refract)-np.sin(newDec)*sinLat)/cosLat
+        newHa = np.arctan2(sinHa,cosHa)
         dRA = hourAngle-newHa
         return dRA,dDec,airmass
 
@@ -69,24 +72,42 @@ class Astrometry:
         arcsec2rad = pi/180./3600
         #from astropy.wcs import WCS
         #W = WCS({"CRVAL1":self.REFRA*180/pi,"CRVAL2":self.REFDEC*180/pi,"CD1_1":1,"CD1_2":0,"CD2_1":0,"CD2_2":1.,"CTYPE1":"RA---TAN","CTYPE2":"DEC--TAN"})
-        X,Y = self.WCS.all_world2pix([ra*180/pi],[dec*180/pi],1)
-        X = X[0]*pi/180
-        Y = Y[0]*pi/180
+        X,Y = self.WCS.all_world2pix(np.atleast_1d(ra*180/pi),np.atleast_1d(dec*180/pi),1)
+        X = X.reshape(np.shape(ra))*pi/180
+        Y = Y.reshape(np.shape(dec))*pi/180
         dist = 1.+self.sitePars["WIYN_PINCUSHION"]*(X*X+Y*Y)
         dist /= self.sitePars["WIYN_SCALE"]*arcsec2rad
         X *= dist
         Y *= dist
         return self.rotatePoint(X,Y)
 
+    @profiled()
     def skyToPlate(self,inRA,inDec):
-        pra,pdec = inRA*pi/180,inDec*pi/180
+        """
+        Convert RA/Dec (in degrees) to guide camera and spectrograph plate
+          coordinates. inRA and inDec may be scalars or arrays; transforming
+          a whole catalog in one call is much faster than point by point.
+        """
+        scalar = np.ndim(inRA)==0 and np.ndim(inDec)==0
+        pra = np.asarray(inRA,dtype=float)*pi/180
+        pdec = np.asarray(inDec,dtype=float)*pi/180
         wra,wdec = self.refractCoords(pra,pdec,True)
         xcam,ycam = self.projectAndCorrect(wra,wdec)
         wra,wdec = self.refractCoords(pra,pdec)
         xspec,yspec = self.projectAndCorrect(wra,wdec)
+        if scalar:
+            return float(xcam),float(ycam),float(xspec),float(yspec)
         return xcam,ycam,xspec,yspec
 
     def plateToSky(self,x,y):
+        """
+        Convert plate coordinates to RA/Dec (in degrees). x and y may be
+          scalars or arrays of plate coordinates.
+        """
+        scalar = np.ndim(x)==0 and np.ndim(y)==0
+        x = np.asarray(x,dtype=float)
+        y = np.asarray(y,dtype=float)
+
         angle = DEG2RAD(self.PA)
         rotC = cos(angle)*self.sitePars["WIYN_SCALE"]/3600.
         rotS = sin(angle)*self.sitePars["WIYN_SCALE"]/3600.
@@ -98,29 +119,74 @@ class Astrometry:
 
         # Calculate the intermediate coordinates
         R = (xi**2+eta**2)**0.5
-        phi = atan2(xi,-eta)
+        phi = np.arctan2(xi,-eta)
 
         # Determine theta from R(theta) (Eqn 68 from WCS paper II).
         # Solution can be found at:
         # https://www.wolframalpha.com/input?i=Solve%5Bx%2BC*x%5E3%3D%3DR%2Cx%5D
         C = self.sitePars["WIYN_PINCUSHION"]*(pi/180)**2
-        rootTerm = (sqrt(3*(27*C*R*R+4)*C**3) + 9*R*C*C)**(1/3)
+        rootTerm = (np.sqrt(3*(27*C*R*R+4)*C**3) + 9*R*C*C)**(1/3)
         nom = (2**(1/3))*rootTerm**2-2*C*3**(1/3)
         dom = (6**(2/3))*C*rootTerm
         theta = 90-nom/dom
 
         # Do the de-projection. See Eqn 2, Section 2.3 of WCS paper II
         #  (the -pi comes from the LONPOLE discussion in the previous section).
-        sinPhi = sin(phi-pi)
-        cosPhi = cos(phi-pi)
-        sinTheta = sin(theta*pi/180)
-        cosTheta = cos(theta*pi/180)
+        sinPhi = np.sin(phi-pi)
+        cosPhi = np.cos(phi-pi)
+        sinTheta = np.sin(theta*pi/180)
+        cosTheta = np.cos(theta*pi/180)
         arg1 = sinTheta*cosDec-cosTheta*sinDec*cosPhi
         arg2 = -1*cosTheta*sinPhi
-        alpha = self.FIELDRA+atan2(arg2,arg1)*180/pi
-        delta = asin(sinTheta*sinDec+cosTheta*cosDec*cosPhi)*180/pi
+        alpha = self.FIELDRA+np.arctan2(arg2,arg1)*180/pi
+        delta = np.arcsin(sinTheta*sinDec+cosTheta*cosDec*cosPhi)*180/pi
+        if scalar:
+            return float(alpha),float(delta)
         return alpha,delta
 
+    def setSkyGrid(self,npts=129):
+        """
+        Tabulate plateToSky() on a regular grid covering the plate. The grid
+          is bilinearly interpolated by gridPlateToSky(), which is cheap
+          enough to call on every mouse move.
+        """
+        edge = self.HydraConfig["PLATE"]
+        axis = np.linspace(-edge,edge,npts)
+        X,Y = np.meshgrid(axis,axis)
+        ra,dec = self.plateToSky(X,Y)
+        # Tabulate unit vectors rather than RA/Dec, which jump by 360 degrees
+        #  at 0h and around the pole
+        ra = ra*pi/180
+        dec = dec*pi/180
+        vectors = (np.cos(dec)*np.cos(ra),np.cos(dec)*np.sin(ra),np.sin(dec))
+        self.skyGrid = (axis[0],axis[1]-axis[0])+vectors
+
+    def gridPlateToSky(self,x,y):
+        """
+        Interpolate RA/Dec (in degrees) from the cached sky grid; x and y may
+          be scalars or arrays. Points off the grid are clamped to its edge.
+        """
+        if self.skyGrid is None:
+            return self.plateToSky(x,y)
+        start,step,vx,vy,vz = self.skyGrid
+        scalar = np.ndim(x)==0 and np.ndim(y)==0
+        npts = vx.shape[0]
+        fx = np.clip((np.asarray(x,dtype=float)-start)/step,0,npts-1)
+        fy = np.clip((np.asarray(y,dtype=float)-start)/step,0,npts-1)
+        ix = np.minimum(fx.astype(int),npts-2)
+        iy = np.minimum(fy.astype(int),npts-2)
+        fx -= ix
+        fy -= iy
+        def interp(grid):
+            lo = grid[iy,ix]*(1-fx)+grid[iy,ix+1]*fx
+            hi = grid[iy+1,ix]*(1-fx)+grid[iy+1,ix+1]*fx
+            return lo*(1-fy)+hi*fy
+        X,Y,Z = interp(vx),interp(vy),interp(vz)
+        alpha = np.arctan2(Y,X)*180/pi%360
+        delta = np.arctan2(Z,np.sqrt(X*X+Y*Y))*180/pi
+        if scalar:
+            return float(alpha),float(delta)
+        return alpha,delta
 
 RADIANS2DEGREES = 180./pi
 DEG93_IN_RADIANS = 93/RADIANS2DEGREES
@@ -281,24 +347,22 @@ C1,C2,C3,C4,C5 = 0.55445,-0.01133,0.00202,0.28385,0.02390
 ZD_THRESHOLD83 = 83./RADIANS2DEGREES
 REF83 = (C1 + C2*7.0 + C3*49.0) / (1.0 + C4*7.0 + C5*49.0)
 def refz(zu,refa,refb):
-    zu1 = min(zu,ZD_THRESHOLD83)
+    zu1 = np.minimum(zu,ZD_THRESHOLD83)
     zl = zu1
-    sine = sin(zl)
-    cosine = cos(zl)
+    sine = np.sin(zl)
+    cosine = np.cos(zl)
     tangent = sine/cosine
     tangent_sqr = tangent*tangent
     tangent_cube = tangent*tangent_sqr
     zl = zl-(refa*tangent + refb*tangent_cube)/(1.+(refa+3*refb*tangent_sqr)/(cosine*cosine))
 
-    sine = sin(zl)
-    cosine = cos(zl)
+    sine = np.sin(zl)
+    cosine = np.cos(zl)
     tangent = sine/cosine
     tangent_sqr = tangent*tangent
     tangent_cube = tangent*tangent_sqr
     ref = zu1-zl+(zl-zu1+refa*tangent+refb*tangent_cube)/(1+(refa+3*refb*tangent_sqr)/(cosine*cosine))
-    if zu>zu1:
-        E = 90.-min(DEG93_IN_RADIANS,zu*RADIANS2DEGREES)
-        E2 = E*E
-        ref = (ref/REF83)*(C1+C2*E+C3*E2)/(1+C4*E+C5*E2)
+    E = 90.-np.minimum(DEG93_IN_RADIANS,zu*RADIANS2DEGREES)
+    E2 = E*E
+    ref = np.where(zu>zu1,(ref/REF83)*(C1+C2*E+C3*E2)/(1+C4*E+C5*E2),ref)
     return zu-ref
-
@@ -1,22 +1,182 @@
+import os
 import random
 import time
-from math import cos,sin,pi,atan2,sqrt,log
+from math import cos,sin,asin,acos,pi,atan2,sqrt,log,ceil,floor
 from PyQt6.QtCore import Qt,pyqtSlot,pyqtSignal
-import shapely
-from multiprocessing import set_start_method
 from .worker import Worker
-
-PROCESS_START_METHOD = "fork"
-set_start_method(PROCESS_START_METHOD)
+from .profiling import profiled
 
 class MPHelper:
     catalog = None
     idmap = None
     fiberGeometries = None
+    fiberAngles = None
+    geometryArrays = None
     footprints = None
     HydraConfig = None
 MPH = MPHelper()
 
+def getCenterlines(x,y,thetas,HydraConfig):
+    """
+    The center lines of the fiber tubes (the points between the segments,
+      starting at the button) for the fibers at angles thetas placed on x,y,
+      as an array of shape (number of fibers, FIBERTUBE_NSEGMENTS+1, 2).
+      These are the points that getFiber() offsets to make the tube.
+    """
+    import numpy as np
+    thetas = np.asarray(thetas,dtype=float)
+    angle = atan2(y,x)
+    if angle<0:
+        angle += 2*pi
+    originDistance = sqrt(x*x+y*y)
+    phi = angle-thetas
+    deflection = originDistance*np.sin(phi)
+    originRadialDistance = originDistance*np.cos(phi)
+    pivotRadialDistance = HydraConfig["PIVOT"]-originRadialDistance
+    eps = np.array(HydraConfig["FIBERTUBE_SEGMENTS"][1:HydraConfig["FIBERTUBE_NSEGMENTS"]+1])
+    deflN = deflection[:,None]*(0.5*eps*eps*eps-1.5*eps+1.)
+    dN = originRadialDistance[:,None]+pivotRadialDistance[:,None]*eps
+    rN = np.sqrt(dN*dN+deflN*deflN)
+    phiN = np.arctan2(deflN,dN)
+    lines = np.empty((len(thetas),len(eps)+1,2))
+    lines[:,0,0] = x
+    lines[:,0,1] = y
+    lines[:,1:,0] = rN*np.cos(thetas[:,None]+phiN)
+    lines[:,1:,1] = rN*np.sin(thetas[:,None]+phiN)
+    return lines
+
+def getGeometryArray(geometries,x,y,thetas,HydraConfig):
+    """
+    The fiber geometries for an object at x,y as (number of fibers, indices
+      of the fibers that can reach the object, array of their geometries,
+      array of their center lines, array of their chords) for
+      getOverlapEntries; thetas are the angles of all of the fibers.
+    """
+    import numpy as np
+    index = np.array([i for i,geo in enumerate(geometries) if geo is not None],dtype=np.intp)
+    geos = np.empty(len(index),dtype=object)
+    geos[:] = [geometries[i] for i in index]
+    lines = getCenterlines(x,y,np.asarray(thetas,dtype=float)[index],HydraConfig)
+    return len(geometries),index,geos,lines,getChords(lines,getCapsuleRadii(HydraConfig))
+
+def setGeometryArrays(indata):
+    """
+    Make the arrays of fiber geometries, footprints and object positions
+      used by populateMatrixEntries.
+    """
+    import numpy as np
+    indata.X = np.array([indata.catalog[objid]["x"] for objid in indata.idmap],dtype=float)
+    indata.Y = np.array([indata.catalog[objid]["y"] for objid in indata.idmap],dtype=float)
+    indata.geometryArrays = [getGeometryArray(geometries,x,y,indata.fiberAngles,indata.HydraConfig) for geometries,x,y in zip(indata.fiberGeometries,indata.X,indata.Y)]
+    indata.footprintArray = np.empty(len(indata.footprints),dtype=object)
+    indata.footprintArray[:] = indata.footprints
+
+def getCapsuleRadii(HydraConfig):
+    """
+    Radii for capsuleTest(): a fiber is inside the union of its button
+      circle and the capsules of radius FIBERTUBE_HALFDIAMETER around the
+      tube segments, and contains the circle inscribed in the button
+      polygon and the center line of the tube.
+    """
+    rad = HydraConfig["FIBERBUTTON_RADIUS"]
+    return HydraConfig["FIBERTUBE_HALFDIAMETER"],rad,rad*cos(pi/HydraConfig["FIBERBUTTON_NCIRC"])
+
+def getChords(lines,radii):
+    """
+    A single capsule around each fiber: the chord from the button center to
+      the end of the tube (columns x1,y1,x2,y2) and a radius (last column)
+      that covers the button and the bend of the tube.
+    """
+    import numpy as np
+    halfDiameter,rad,inner = radii
+    chords = np.empty((len(lines),5))
+    chords[:,:2] = lines[:,0]
+    chords[:,2:4] = lines[:,-1]
+    DX = chords[:,2:3]-chords[:,0:1]
+    DY = chords[:,3:4]-chords[:,1:2]
+    X = lines[:,1:-1,0]-chords[:,0:1]
+    Y = lines[:,1:-1,1]-chords[:,1:2]
+    bend = (np.abs(DX*Y-DY*X)/np.sqrt(DX*DX+DY*DY)).max(-1,initial=0.)
+    chords[:,4] = np.maximum(rad,halfDiameter+bend)
+    return chords
+
+def pointSegmentDistance2(PX,PY,X1,Y1,DX,DY):
+    """
+    Squared distance of points from the segments from X1,Y1 to X1+DX,Y1+DY.
+    """
+    import numpy as np
+    X = PX-X1
+    Y = PY-Y1
+    t = np.clip((X*DX+Y*DY)/(DX*DX+DY*DY),0.,1.)
+    X = X-t*DX
+    Y = Y-t*DY
+    return X*X+Y*Y
+
+def chordTest(chordsA,chordsB):
+    """
+    Whether each fiber of chordsA (rows) can collide with each fiber of
+      chordsB (columns), from the distance between their chords.
+    """
+    import numpy as np
+    AX,AY,ADX,ADY = chordsA[:,0,None],chordsA[:,1,None],chordsA[:,2,None]-chordsA[:,0,None],chordsA[:,3,None]-chordsA[:,1,None]
+    BX,BY,BDX,BDY = chordsB[:,0],chordsB[:,1],chordsB[:,2]-chordsB[:,0],chordsB[:,3]-chordsB[:,1]
+    distance = np.minimum(np.minimum(pointSegmentDistance2(AX,AY,BX,BY,BDX,BDY),pointSegmentDistance2(AX+ADX,AY+ADY,BX,BY,BDX,BDY)),
+                          np.minimum(pointSegmentDistance2(BX,BY,AX,AY,ADX,ADY),pointSegmentDistance2(BX+BDX,BY+BDY,AX,AY,ADX,ADY)))
+    # Chords that cross
+    crossing = ((ADX*(BY-AY)-ADY*(BX-AX))*(ADX*(BY+BDY-AY)-ADY*(BX+BDX-AX))<0) & ((BDX*(AY-BY)-BDY*(AX-BX))*(BDX*(AY+ADY-BY)-BDY*(AX+ADX-BX))<0)
+    radius = chordsA[:,4,None]+chordsB[:,4]+1e-6
+    return crossing | (distance<radius*radius)
+
+def capsuleTest(linesA,linesB,radii):
+    """
+    Analytic collision test of pairs of fibers, given by their center lines
+      (from getCenterlines) linesA[k] and linesB[k]. Returns two boolean
+      arrays: the pairs that are clearly apart and the pairs that clearly
+      overlap. The borderline pairs (neither) need the polygon test.
+    """
+    import numpy as np
+    halfDiameter,rad,inner = radii
+    tolerance = 1e-6
+    # Squared distances and sides of the points of one line relative to
+    #  the segments of the other, shape (pairs,points,segments)
+    def relate(PX,PY,SX,SY):
+        X1 = SX[:,None,:-1]
+        Y1 = SY[:,None,:-1]
+        DX = SX[:,None,1:]-X1
+        DY = SY[:,None,1:]-Y1
+        X = PX[:,:,None]-X1
+        Y = PY[:,:,None]-Y1
+        t = np.clip((X*DX+Y*DY)/(DX*DX+DY*DY),0.,1.)
+        side = DX*Y-DY*X
+        X -= t*DX
+        Y -= t*DY
+        return X*X+Y*Y,side
+    AX,AY = linesA[...,0],linesA[...,1]
+    BX,BY = linesB[...,0],linesB[...,1]
+    distA,sideA = relate(AX,AY,BX,BY)
+    distB,sideB = relate(BX,BY,AX,AY)
+    # Segments cross if the ends of each are on opposite sides of the other
+    crossing = ((sideA[:,:-1]*sideA[:,1:]<0) & (sideB[:,:-1]*sideB[:,1:]<0).transpose(0,2,1)).any(axis=(1,2))
+    # The closest approach of two lines that don't cross is at a point of
+    #  one of them; the first point is the button center
+    tubes = np.minimum(distA.min(axis=(1,2)),distB.min(axis=(1,2)))
+    buttonA = distA[:,0].min(-1)
+    buttonB = distB[:,0].min(-1)
+    buttons = (AX[:,0]-BX[:,0])**2+(AY[:,0]-BY[:,0])**2
+    outer = rad+halfDiameter+tolerance
+    clear = ~crossing & (tubes>(2*halfDiameter+tolerance)**2) & (buttonA>outer*outer) & (buttonB>outer*outer) & (buttons>(2*rad+tolerance)**2)
+    overlap = crossing | (buttonA<(inner-tolerance)**2) | (buttonB<(inner-tolerance)**2) | (buttons<(2*inner-tolerance)**2)
+    return clear,overlap
+
+def initializeWorker(HydraConfig):
+    """
+    Set up a process of the shared worker pool (see workerpool.py) with the
+      static fiber configuration and load the modules used by the jobs.
+    """
+    import shapely
+    import numpy
+    MPH.HydraConfig = HydraConfig
+
 """
 Function to create matrix entries.
 
@@ -24,7 +184,8 @@ This is in global scope to allow pickling for multi-processing.
 
 args -- either a tuple including an optID and MPHelper data structure
           or just an optID (in which case the global MPH structure is
-          used)
+          used); the configuration of the worker is used if the data
+          has none
 """
 def populateMatrixEntries(args):
     if type(args)==tuple:
@@ -32,52 +193,72 @@ def populateMatrixEntries(args):
     else:
         optID = args
         indata = MPH
+    if indata.HydraConfig is None:
+        indata.HydraConfig = MPH.HydraConfig
+    import shapely
+    import numpy as np
+    # The arrays are made once for all objects by createMatrix
+    if indata.geometryArrays is None:
+        setGeometryArrays(indata)
     buttonDiameter = indata.HydraConfig["FIBERBUTTON_RADIUS"]*2
-    objid = indata.idmap[optID]
-    x = indata.catalog[objid]["x"]
-    y = indata.catalog[objid]["y"]
+    x = indata.X[optID]
+    y = indata.Y[optID]
     footprint = indata.footprints[optID]
 
-    geometries = indata.fiberGeometries[optID]
-    Nfibers = len(geometries)
+    # Test the buttons and footprints against all later objects at once
+    others = slice(optID+1,len(indata.idmap))
+    dx = indata.X[others]-x
+    dy = indata.Y[others]-y
+    close = np.sqrt(dx*dx+dy*dy)<buttonDiameter
+    overlap = shapely.intersects(footprint,indata.footprintArray[others])
     entries = []
-    for optID2 in range(optID+1,len(indata.idmap)):
-        footprint2 = indata.footprints[optID2]
-        objid2 = indata.idmap[optID2]
-        x0,y0 = indata.catalog[objid2]["x"],indata.catalog[objid2]["y"]
-        geometries2 = indata.fiberGeometries[optID2]
-        entry = getMatrixEntry(x,y,footprint,geometries,optID,optID2,x0,y0,footprint2,geometries2,buttonDiameter)
-        entries.append(entry)
+    overlapping = []
+    for index,optID2 in enumerate(range(optID+1,len(indata.idmap))):
+        if close[index]:
+            entries.append([0])
+        elif not overlap[index]:
+            entries.append([1])
+        else:
+            entries.append(None)
+            overlapping.append(index)
+    candidates = [indata.geometryArrays[optID+1+index] for index in overlapping]
+    overlapEntries = getOverlapEntries(indata.geometryArrays[optID],candidates,getCapsuleRadii(indata.HydraConfig))
+    for index,entry in zip(overlapping,overlapEntries):
+        entries[index] = entry
     return entries
 
-def getMatrixEntry(x,y,footprint,geometries,optID,optID2,x0,y0,footprint2,geometries2,buttonDiameter):
-    # Buttons always collide
-    if sqrt((x-x0)*(x-x0)+(y-y0)*(y-y0))<buttonDiameter:
-        return [0]
-        # Fibers never overlap
-    if not shapely.intersects(footprint,footprint2):
-        return [1]
-    overlaps = [0]*len(geometries)
-    Aindex = []
-    for A,GA in enumerate(geometries):
-        if GA is None:
-            continue
-        if shapely.intersects(GA,footprint2):
-            Aindex.append(A)
-    Bindex = [] 
-    for B,GB in enumerate(geometries2):
-        if GB is None:
-            continue
-        if shapely.intersects(GB,footprint):
-            Bindex.append(B)
-    for A in Aindex:
-        matches = 0
-        fiberA = geometries[A]
-        for B in Bindex:
-            if shapely.intersects(fiberA,geometries2[B]):
-                matches |= 1<<B
-        overlaps[A] = matches
-    return [2,overlaps]
+def getOverlapEntries(geometries,others,radii,chunkSize=8192):
+    """
+    The [2,overlaps] entries of an object against each of a list of objects
+      with overlapping footprints (all given by the arrays from
+      getGeometryArray). The fiber pairs are settled by chordTest() and
+      capsuleTest() where possible; only the borderline pairs are tested
+      with shapely.
+    """
+    import shapely
+    import numpy as np
+    N,indexA,GA,linesA,chordsA = geometries
+    entries = [[2,[0]*N] for _ in others]
+    if len(indexA)==0 or len(others)==0:
+        return entries
+    # All of the fibers of the other objects in one array
+    owners = np.concatenate([np.full(len(_[1]),k,dtype=np.intp) for k,_ in enumerate(others)])
+    indexB = np.concatenate([_[1] for _ in others])
+    GB = np.concatenate([_[2] for _ in others])
+    linesB = np.concatenate([_[3] for _ in others])
+    chordsB = np.concatenate([_[4] for _ in others])
+    # Most pairs are far apart and settled by the chords alone
+    pairsA,pairsB = np.nonzero(chordTest(chordsA,chordsB))
+    for start in range(0,len(pairsA),chunkSize):
+        A = pairsA[start:start+chunkSize]
+        B = pairsB[start:start+chunkSize]
+        clear,overlap = capsuleTest(linesA[A],linesB[B],radii)
+        border = ~clear & ~overlap
+        overlap[border] = shapely.intersects(GA[A[border]],GB[B[border]])
+        A,B = A[overlap],B[overlap]
+        for A,owner,B in zip(indexA[A].tolist(),owners[B].tolist(),indexB[B].tolist()):
+            entries[owner][1][A] |= 1<<B
+    return entries
 
 
 class CollisionMatrix:
@@ -87,6 +268,14 @@ class CollisionMatrix:
     REOPT = False
     buttonX = None
     buttonY = None
+    reachIndex = None
+    # Build the placement data for the working fibers of both cables when a
+    #  field is loaded, and derive the data for the field's cable from it
+    #  (selectActiveFibers); otherwise this is done at the first switchCable
+    ALLCABLES = os.environ.get("NEWHYDRA_ALL_CABLES","0")!="0"
+    sharedPlacement = None
+    sharedFootprints = None
+    workerPool = None
     INITIALIZING = True
 
     def populateMatrixEntries(self,optID):
@@ -94,21 +283,44 @@ class CollisionMatrix:
         MPH.catalog = self.catalog
         MPH.idmap = self.idmap
         MPH.fiberGeometries = self.fiberGeometries
+        MPH.fiberAngles = self.getFiberAngles()
         MPH.footprints = self.footprints
         MPH.HydraConfig = self.HydraConfig
         return populateMatrixEntries((optID,MPH))
 
-    def getMatrixEntry(self,optID,optID2):
+    def getGeometryArray(self,optID):
+        """
+        The fiber geometry arrays of an object for getOverlapEntries().
+        """
+        objid = self.idmap[optID]
+        x,y = self.catalog[objid]["x"],self.catalog[objid]["y"]
+        return getGeometryArray(self.fiberGeometries[optID],x,y,self.getFiberAngles(),self.HydraConfig)
+
+    def getMatrixEntry(self,optID,optID2,geometries2=None):
+        """
+        Collision entry for a pair of objects: [0] if they always collide, [1]
+          if they never do, or [2,overlaps] where overlaps[A] has bit B set if
+          fiber A on optID collides with fiber B on optID2. geometries2 are
+          the arrays of optID2, if they have already been made.
+        """
+        import shapely
         objid = self.idmap[optID]
-        x = self.catalog[objid]["x"]
-        y = self.catalog[objid]["y"]
-        footprint = self.footprints[optID]
-        geometries = self.fiberGeometries[optID]
-        footprint2 = self.footprints[optID2]
+        x,y = self.catalog[objid]["x"],self.catalog[objid]["y"]
         objid2 = self.idmap[optID2]
         x0,y0 = self.catalog[objid2]["x"],self.catalog[objid2]["y"]
-        geometries2 = self.fiberGeometries[optID2]
-        return getMatrixEntry(x,y,footprint,geometries,optID,optID2,x0,y0,footprint2,geometries2,self.HydraConfig["FIBERBUTTON_RADIUS"]*2)
+        # Buttons always collide
+        if sqrt((x-x0)*(x-x0)+(y-y0)*(y-y0))<self.HydraConfig["FIBERBUTTON_RADIUS"]*2:
+            return [0]
+        # Fibers never overlap
+        if not shapely.intersects(self.footprints[optID],self.footprints[optID2]):
+            return [1]
+        # Only the overlapping pairs need the fiber geometries
+        if geometries2 is None:
+            geometries2 = self.getGeometryArray(optID2)
+        return getOverlapEntries(self.getGeometryArray(optID),[geometries2],getCapsuleRadii(self.HydraConfig))[0]
+
+    def getFiberAngles(self):
+        return [self.FiberDB[str(fibid)]["theta"] for fibid in self.fibers]
 
     def setButtons(self):
         rad = self.HydraConfig["FIBERBUTTON_RADIUS"]
@@ -116,7 +328,14 @@ class CollisionMatrix:
         self.buttonX = [rad*cos(i*2*pi/npts) for i in range(npts)]
         self.buttonY = [rad*sin(i*2*pi/npts) for i in range(npts)]
 
-    def getFiber(self,fibid,coords=None):
+    def getFiber(self,fibid,coords=None,limits=True):
+        """
+        Fiber tube and button polygon for fibid at coords (the park position
+          by default), or None if the position is out of reach; limits=False
+          always returns the geometry. coords may be (x,y), (x,y,angle) or
+          (x,y,angle,button).
+        """
+        import shapely
         if self.buttonX is None:
             self.setButtons()
         sfibid = str(fibid)
@@ -132,13 +351,16 @@ class CollisionMatrix:
             if len(coords)==4:
                 x,y,angle,button = coords
             else:
-                x,y = coords
-                angle = atan2(y,x)
-                if angle<0:
-                    angle += 2*pi
+                if len(coords)==3:
+                    x,y,angle = coords
+                else:
+                    x,y = coords
+                    angle = atan2(y,x)
+                    if angle<0:
+                        angle += 2*pi
                 button = shapely.Polygon([(bx+x,by+y) for bx,by in zip(self.buttonX,self.buttonY)])
         extent = sqrt((fibx-x)*(fibx-x)+(fiby-y)*(fiby-y))
-        if extent>self.HydraConfig["MAXEXTEND"]:
+        if limits and extent>self.HydraConfig["MAXEXTEND"]:
             return None
         originDistance = sqrt(x*x+y*y)
         phi = angle-theta
@@ -146,7 +368,7 @@ class CollisionMatrix:
         originRadialDistance = originDistance*cos(phi)
         pivotRadialDistance = self.HydraConfig["PIVOT"]-originRadialDistance
         psi = atan2(deflection,pivotRadialDistance)
-        if abs(psi)>self.HydraConfig["MAXANGLE"]:
+        if limits and abs(psi)>self.HydraConfig["MAXANGLE"]:
             return None
         npnts = self.HydraConfig["FIBERTUBE_NSEGMENTS"]*2+2
         tx,ty = [0]*10,[0]*npnts
@@ -182,7 +404,60 @@ class CollisionMatrix:
         shapely.prepare(geo)
         return geo
 
+    def getReachAngle(self,r):
+        """
+        The largest angle between an object at radius r and the pivot of a
+          fiber that can reach it within MAXANGLE and MAXEXTEND.
+        """
+        P = self.HydraConfig["PIVOT"]
+        E = self.HydraConfig["MAXEXTEND"]
+        M = self.HydraConfig["MAXANGLE"]
+        if r<=0.:
+            return pi
+        # The extent grows with the angle
+        reach = acos(max(-1.,min(1.,(P*P+r*r-E*E)/(2*P*r))))
+        # The bend reaches MAXANGLE where sin(angle+MAXANGLE)=P*sin(MAXANGLE)/r
+        #  (the law of sines), and comes back below it at large angles
+        s = P*sin(M)/r
+        if s>=1. or pi-asin(s)-M<=reach:
+            return reach
+        return min(reach,asin(s)-M)
+
+    def getCandidateFibers(self,r,angle):
+        """
+        Indices in self.fibers of the fibers that may reach an object at
+          polar coordinates r,angle: the pivots are evenly spaced at
+          2*pi*fiber/NFIBERS, so these are the fibers in a range of angles.
+        """
+        NFIBERS = self.HydraConfig["NFIBERS"]
+        if self.reachIndex is None or self.reachIndex[0] is not self.fibers:
+            index = [[] for _ in range(NFIBERS)]
+            for fibIndex,fibid in enumerate(self.fibers):
+                theta = self.FiberDB[str(fibid)]["theta"]
+                index[int(round(theta*NFIBERS/(2*pi)))%NFIBERS].append(fibIndex)
+            self.reachIndex = (self.fibers,index)
+        index = self.reachIndex[1]
+        # A little extra for rounding
+        reach = self.getReachAngle(r)+1e-6
+        if reach>=pi:
+            return [fibIndex for _ in index for fibIndex in _]
+        lo = ceil((angle-reach)*NFIBERS/(2*pi))
+        hi = floor((angle+reach)*NFIBERS/(2*pi))
+        return [fibIndex for fiber in range(lo,hi+1) for fibIndex in index[fiber%NFIBERS]]
+
+    def getObjectFiber(self,fibid,obj,coords):
+        """
+        The geometry of fiber fibid on the object obj at coords (see
+          getFiber), or None if the fiber can't take the object.
+        """
+        # FOPS fibers only take FOPS stars, and vice versa
+        if obj["type"]=='F' or self.FiberDB[str(fibid)]["cable"]=='F':
+            if obj["type"]!=self.FiberDB[str(fibid)]["cable"]:
+                return None
+        return self.getFiber(fibid,coords)
+
     def addCatalogObject(self,optID,objid,obj):
+        import shapely
         #objid,obj = data
         #self.idmap.append(objid)
         x = obj["x"]
@@ -198,19 +473,14 @@ class CollisionMatrix:
             passThru = True
         self.idmap.append(objid)
         self.weights.append(obj["weight"])
-        geometries = []
+        geometries = [None]*len(self.fibers)
         button = shapely.Polygon([(bx+x,by+y) for bx,by in zip(self.buttonX,self.buttonY)])
-        for fibIndex,fibid in enumerate(self.fibers):
-            if passThru:
-                geometries.append(None)
-                continue
-            if obj["type"]=='F' or self.FiberDB[str(fibid)]["cable"]=='F':
-                if obj["type"]!=self.FiberDB[str(fibid)]["cable"]:
-                    geometries.append(None)
-                    continue
-            geo = self.getFiber(fibid,(x,y,angle,button))
+        # Only the fibers with pivots close enough in angle can reach it
+        candidates = [] if passThru else self.getCandidateFibers(originDistance,angle)
+        for fibIndex in candidates:
+            fibid = self.fibers[fibIndex]
+            geo = self.getObjectFiber(fibid,obj,(x,y,angle,button))
             if geo is None:
-                geometries.append(None)
                 continue
             # Check that fiber won't hit parked fibers on either side
             """
@@ -219,16 +489,32 @@ class CollisionMatrix:
             lo = (fibid-1)%self.HydraConfig["NFIBERS"]
             hi = (fibid+1)%self.HydraConfig["NFIBERS"]
             if (not self.FiberDB[str(lo)]["active"] and shapely.intersects(geo,self.parkedGeometries[lo])) or (not self.FiberDB[str(hi)]["active"] and shapely.intersects(geo,self.parkedGeometries[hi])):
-                geometries.append(None)
                 continue
             """
             self.objList[fibIndex].append(optID)
-            geometries.append(geo)
+            geometries[fibIndex] = geo
         self.fiberGeometries.append(geometries)
         footprint = shapely.union_all(geometries)
         shapely.prepare(footprint)
         self.footprints.append(footprint)
 
+    def getActiveFibers(self,allCables=False):
+        """
+        The active fibers and the indices of the FOPS fibers among them;
+          allCables also includes the working fibers of the other cable.
+        """
+        fibers = []
+        FOPSindex = []
+        for fibid,data in self.FiberDB.items():
+            fibid = int(fibid)
+            #self.parkedGeometries.append(self.getFiber(fibid))
+            if data["active"] or (allCables and data["status"]=="A" and data["cable"] in ("R","B")):
+                if data["cable"]=="F":
+                    FOPSindex.append(len(fibers))
+                fibers.append(fibid)
+        return fibers,FOPSindex
+
+    @profiled()
     def prepPlacement(self):
         self.setButtons()
 
@@ -238,22 +524,218 @@ class CollisionMatrix:
         self.idmap = []
         self.weights = []
 
-        self.fibers = []
         self.parkedGeometries = []
-        self.FOPSindex = []
-        for fibid,data in self.FiberDB.items():
-            fibid = int(fibid)
-            #self.parkedGeometries.append(self.getFiber(fibid))
-            if data["active"]:
-                if data["cable"]=="F":
-                    self.FOPSindex.append(len(self.fibers))
-                self.fibers.append(fibid)
+        self.fibers,self.FOPSindex = self.getActiveFibers(self.ALLCABLES)
         self.objList = [[] for _ in self.fibers]
         self.objListWeights = [[] for _ in self.fibers]
 
         for optID,(objid,obj) in enumerate(self.catalog.items()):
             self.addCatalogObject(optID,objid,obj)
 
+    @profiled()
+    def updateActiveFibers(self,allCables=False):
+        """
+        Update the placement data and collision matrix (eg, loaded from the
+          cache) for the fibers that are active now, or with allCables (or
+          ALLCABLES) the working fibers of both cables. The entries of the
+          fibers that are no longer used are dropped, the other bits are
+          moved to the new fiber indices, and only the new fibers are
+          tested against the objects. Returns True if the fibers have
+          changed.
+        """
+        import shapely
+        import numpy as np
+        fibers,FOPSindex = self.getActiveFibers(allCables or self.ALLCABLES)
+        FOPS = set(fibers[i] for i in FOPSindex)
+        oldFOPS = set(self.fibers[i] for i in self.FOPSindex)
+        if fibers==self.fibers and FOPS==oldFOPS:
+            return False
+        # A fiber that changed to or from the FOPS cable is a new fiber
+        oldIndex = {fibid:index for index,fibid in enumerate(self.fibers) if (fibid in FOPS)==(fibid in oldFOPS)}
+        mapping = [oldIndex.get(fibid) for fibid in fibers]
+        newIndex = {old:new for new,old in enumerate(mapping) if old is not None}
+        added = [new for new,old in enumerate(mapping) if old is None]
+        removed = [old for old in range(len(self.fibers)) if old not in newIndex]
+        self.fibers = fibers
+        self.FOPSindex = FOPSindex
+        N = len(fibers)
+
+        def remap(bits):
+            remapped = 0
+            while bits:
+                low = bits&-bits
+                old = low.bit_length()-1
+                if old in newIndex:
+                    remapped |= 1<<newIndex[old]
+                bits ^= low
+            return remapped
+
+        # The geometries of the remaining fibers are kept; the new fibers
+        #  are tested against the objects they may reach
+        changed = []
+        addedGeometries = []
+        addedSet = set(added)
+        for optID,objid in enumerate(self.idmap):
+            geometries = self.fiberGeometries[optID]
+            changes = any(geometries[old] is not None for old in removed)
+            geometries = [geometries[old] if old is not None else None for old in mapping]
+            newGeometries = [None]*N
+            obj = self.catalog[objid]
+            x,y = obj["x"],obj["y"]
+            angle = atan2(y,x)
+            if angle<0:
+                angle += 2*pi
+            originDistance = sqrt(x*x+y*y)
+            if added and originDistance<=self.HydraConfig["PLATE"]:
+                for fibIndex in self.getCandidateFibers(originDistance,angle):
+                    if fibIndex in addedSet:
+                        geo = self.getObjectFiber(fibers[fibIndex],obj,(x,y,angle))
+                        if geo is not None:
+                            geometries[fibIndex] = geo
+                            newGeometries[fibIndex] = geo
+                            changes = True
+            self.fiberGeometries[optID] = geometries
+            addedGeometries.append(newGeometries)
+            if changes:
+                changed.append(optID)
+                footprint = shapely.union_all(geometries)
+                shapely.prepare(footprint)
+                self.footprints[optID] = footprint
+        self.objList = [[optID for optID,geometries in enumerate(self.fiberGeometries) if geometries[fibIndex] is not None] for fibIndex in range(N)]
+        self.objListWeights = [[] for _ in fibers]
+
+        # Move the bits of the remaining fibers
+        for row in self.MATRIX:
+            for entry in row:
+                if entry[0]==2:
+                    overlaps = entry[1]
+                    entry[1] = [remap(overlaps[old]) if old is not None and overlaps[old] else 0 for old in mapping]
+
+        # The footprints of the changed objects may now (not) overlap others
+        footprintArray = np.empty(len(self.footprints),dtype=object)
+        footprintArray[:] = self.footprints
+        for optID in changed:
+            overlap = shapely.intersects(self.footprints[optID],footprintArray)
+            for optID2 in range(len(self.idmap)):
+                if optID2==optID:
+                    continue
+                i,j = min(optID,optID2),max(optID,optID2)
+                entry = self.MATRIX[i][j-i-1]
+                if entry[0]==0:
+                    continue
+                if not overlap[optID2]:
+                    self.MATRIX[i][j-i-1] = [1]
+                elif entry[0]==1:
+                    self.MATRIX[i][j-i-1] = [2,[0]*N]
+
+        # Test the new fibers on each object against all fibers on the others
+        thetas = self.getFiberAngles()
+        radii = getCapsuleRadii(self.HydraConfig)
+        X = [self.catalog[objid]["x"] for objid in self.idmap]
+        Y = [self.catalog[objid]["y"] for objid in self.idmap]
+        arrays = {}
+        for optID,newGeometries in enumerate(addedGeometries):
+            if all(geo is None for geo in newGeometries):
+                continue
+            others = []
+            for optID2 in range(len(self.idmap)):
+                i,j = min(optID,optID2),max(optID,optID2)
+                if optID2!=optID and self.MATRIX[i][j-i-1][0]==2:
+                    others.append(optID2)
+            if len(others)==0:
+                continue
+            for optID2 in others:
+                if optID2 not in arrays:
+                    arrays[optID2] = getGeometryArray(self.fiberGeometries[optID2],X[optID2],Y[optID2],thetas,self.HydraConfig)
+            geometries = getGeometryArray(newGeometries,X[optID],Y[optID],thetas,self.HydraConfig)
+            for optID2,entry in zip(others,getOverlapEntries(geometries,[arrays[_] for _ in others],radii)):
+                if optID<optID2:
+                    overlaps = self.MATRIX[optID][optID2-optID-1][1]
+                    for A,bits in enumerate(entry[1]):
+                        overlaps[A] |= bits
+                else:
+                    # The entry is stored with the fibers of optID2 first
+                    overlaps = self.MATRIX[optID2][optID-optID2-1][1]
+                    for A,bits in enumerate(entry[1]):
+                        while bits:
+                            low = bits&-bits
+                            overlaps[low.bit_length()-1] |= 1<<A
+                            bits ^= low
+        return True
+
+    def shareActiveFibers(self):
+        """
+        Keep the placement data made for the fibers of both cables (see
+          ALLCABLES) and use the data for the active fibers.
+        """
+        self.sharedPlacement = (list(self.idmap),self.fibers,self.FOPSindex,self.fiberGeometries,self.footprints,self.MATRIX)
+        self.sharedFootprints = {}
+        self.selectActiveFibers()
+
+    @profiled()
+    def selectActiveFibers(self):
+        """
+        Derive the placement data for the active fibers from the shared data
+          by masking out the other fibers. Returns False if the shared data
+          can't be used, ie the catalog has changed or an active fiber wasn't
+          shared.
+        """
+        import shapely
+        if self.sharedPlacement is None:
+            return False
+        idmap,sharedFibers,sharedFOPSindex,fiberGeometries,footprints,MATRIX = self.sharedPlacement
+        if idmap!=self.idmap:
+            return False
+        fibers,FOPSindex = self.getActiveFibers()
+        sharedIndex = {fibid:index for index,fibid in enumerate(sharedFibers)}
+        if any(fibid not in sharedIndex for fibid in fibers):
+            return False
+        keep = [sharedIndex[fibid] for fibid in fibers]
+        FOPS = set(keep[i] for i in FOPSindex)
+        if FOPS!=set(sharedFOPSindex)&set(keep):
+            return False
+        self.fibers = fibers
+        self.FOPSindex = FOPSindex
+        newIndex = {old:new for new,old in enumerate(keep)}
+
+        def mask(bits):
+            masked = 0
+            while bits:
+                low = bits&-bits
+                old = low.bit_length()-1
+                if old in newIndex:
+                    masked |= 1<<newIndex[old]
+                bits ^= low
+            return masked
+
+        self.fiberGeometries = [[geometries[old] for old in keep] for geometries in fiberGeometries]
+        # The footprints of objects that lost fibers are made again (once
+        #  for each set of fibers), as addTarget() tests new objects
+        #  against them
+        key = tuple(keep)
+        if key not in self.sharedFootprints:
+            masked = []
+            for geometries,maskedGeometries,footprint in zip(fiberGeometries,self.fiberGeometries,footprints):
+                if sum(geo is not None for geo in maskedGeometries)!=sum(geo is not None for geo in geometries):
+                    footprint = shapely.union_all(maskedGeometries)
+                    shapely.prepare(footprint)
+                masked.append(footprint)
+            self.sharedFootprints[key] = masked
+        self.footprints = list(self.sharedFootprints[key])
+        self.objList = [[optID for optID,geometries in enumerate(self.fiberGeometries) if geometries[fibIndex] is not None] for fibIndex in range(len(fibers))]
+        self.objListWeights = [[] for _ in fibers]
+        # Pairs of objects whose remaining fibers don't overlap never collide
+        self.MATRIX = []
+        for row in MATRIX:
+            maskedRow = []
+            for entry in row:
+                if entry[0]==2:
+                    overlaps = [mask(entry[1][old]) if entry[1][old] else 0 for old in keep]
+                    entry = [2,overlaps] if any(overlaps) else [1]
+                maskedRow.append(entry)
+            self.MATRIX.append(maskedRow)
+        return True
+
     def setMatrix(self):
         """
         Wrapper routine for createMatrix(), which spawns in a worker thread
@@ -268,72 +750,51 @@ class CollisionMatrix:
         myWindow.exec_()
         self.updateProgressSignal.disconnect(myWindow.updateProgress)
 
+    def getWorkerPool(self):
+        """
+        The process pool shared by the batch jobs; it is started when it is
+          first used.
+        """
+        if self.workerPool is None:
+            from .workerpool import WorkerPool
+            CollisionMatrix.workerPool = WorkerPool(initializeWorker,(self.HydraConfig,))
+        return self.workerPool
+
+    def stopWorkerPool(self):
+        if self.workerPool is not None:
+            self.workerPool.shutdown()
+
+    @profiled()
     def createMatrix(self):
-        from multiprocessing import Pool,cpu_count
+        # The workers start up while the geometries are made
+        pool = self.getWorkerPool()
+        pool.start()
         self.prepPlacement()
-        ncpu = cpu_count()
-        if ncpu<=2:
-            ncpu = 1
-        else:
-            ncpu -= 2
-        if ncpu>8:
-            ncpu = 8
         N = len(self.idmap)
 
-        #set_start_method(PROCESS_START_METHOD)
-        # 'spawn' can be slower and doesn't show progress easily
-        if PROCESS_START_METHOD=="spawn":
-            # spawn passes the data to each process instead of using the
-            #  global MPH data structure
-            indata = MPHelper()
-            indata.catalog = self.catalog
-            indata.idmap = self.idmap
-            indata.fiberGeometries = self.fiberGeometries
-            indata.footprints = self.footprints
-            indata.HydraConfig = self.HydraConfig
-
-            indices = []
-            inp = []
-            chunkSize = N//ncpu
-            count = 0
-            for i in range(ncpu):
-                for j in range(chunkSize):
-                    inp.append((j*ncpu+i,indata))
-                    indices.append(j*ncpu+i)
-                    count += 1
-            while count<N:
-                inp.append((count,indata))
-                indices.append(count)
-                count += 1
-        else:
-            # fork uses the global MPH data structure
-            MPH.catalog = self.catalog
-            MPH.idmap = self.idmap
-            MPH.fiberGeometries = self.fiberGeometries
-            MPH.footprints = self.footprints
-            MPH.HydraConfig = self.HydraConfig
-
-            inp = [_ for _ in range(N)]
-            chunkSize = 1
+        # The workers get the field data from a file, once per worker; they
+        #  already have the configuration
+        indata = MPHelper()
+        indata.catalog = self.catalog
+        indata.idmap = self.idmap
+        indata.fiberGeometries = self.fiberGeometries
+        indata.fiberAngles = self.getFiberAngles()
+        indata.footprints = self.footprints
+        indata.HydraConfig = self.HydraConfig
+        setGeometryArrays(indata)
+        indata.catalog = None
+        indata.HydraConfig = None
+
         t = time.time()
-        with Pool(ncpu) as pool:
-            result = pool.map_async(populateMatrixEntries,inp,chunksize=chunkSize)
-            PTOTAL = [10*i for i in range(10)]
-            while True:
-                if result.ready():
-                    break
-                P = int(100*(N-result._number_left)/N)
-                if len(PTOTAL) and P>=PTOTAL[0]:
-                    self.updateProgressSignal.emit(P)
-                    del PTOTAL[0]
-            MATRIX = result.get()
-
-        if PROCESS_START_METHOD=="spawn":
-            self.MATRIX = [[] for _ in range(N)]
-            for index1,index2 in enumerate(indices):
-                self.MATRIX[index2] = MATRIX[index1]
-        else:
-            self.MATRIX = MATRIX
+        MATRIX = []
+        # Rows arrive in order as they are done; report every 10%
+        nextP = 10
+        for entries in pool.imap(populateMatrixEntries,range(N),indata):
+            MATRIX.append(entries)
+            P = 100*len(MATRIX)//N
+            if P>=nextP:
+                self.updateProgressSignal.emit(P)
+                nextP = P-P%10+10
+        self.MATRIX = MATRIX
         self.updateProgressSignal.emit(100)
         self.printMessageSignal.emit("Matrix created in {:.1f} seconds.".format(time.time()-t))
-
@@ -1,6 +1,6 @@
 from PyQt6.QtWidgets import QGraphicsView,QGraphicsScene,QGraphicsEllipseItem, \
         QGraphicsLineItem,QGraphicsPolygonItem,QGraphicsRectItem,QMenu, \
-        QGraphicsPathItem
+        QGraphicsPathItem,QGraphicsItem
 from PyQt6.QtGui import QPainter,QColor,QBrush,QPen,QPolygonF,QPainterPath, \
         QTransform,QPainterPathStroker,QFont
 from PyQt6.QtCore import Qt,QPointF,QPoint,QRectF
@@ -194,8 +194,8 @@ class Button(QGraphicsEllipseItem):
 class Fiber:
     """
     Fiber describes the full fiber object, including the button and the fiber
-      tube. Note that the tube has two components, the visual component and
-      a `shadow' component for collision detection consistent with the server.
+      tube. Collisions are not tested with the scene; the manager compares
+      the same fiber geometry used by the optimizer (CollisionMatrix.getFiber).
     """
     def __init__(self,data,manager):
         from math import atan2
@@ -225,6 +225,17 @@ class Fiber:
 
         self.plotButton = Button(self.BUTTONSIZE,self)
         self.plotFiber = QGraphicsPathItem()
+        self.setFiberPen()
+
+        self.plotFiber.setOpacity(0.7)
+        self.setObject(data["object"])
+
+        self.manager.fiberScene.addItem(self.plotFiber)
+        self.manager.fiberScene.addItem(self.plotButton)
+        # Collisions are checked by the manager once all fibers exist
+        self.drawFiber(False)
+
+    def setFiberPen(self):
         if self.cable=='R':
             self.plotFiber.setPen(QPen(Qt.GlobalColor.red,0.))
         elif self.cable=='B':
@@ -234,18 +245,15 @@ class Fiber:
         else:
             self.plotFiber.setPen(QPen(Qt.GlobalColor.black,0.))
 
-        self.plotFiber.setOpacity(0.7)
-        self.collisionFiber = QGraphicsPolygonItem()
-        self.collisionFiber.setPen(nullPen)
-        self.collisionFiber.setOpacity(0.)
-        self.collisionFiber.fibid = self.fibid
-        self.setFiber()
-        self.setObject(data["object"])
-
-        self.manager.fiberScene.addItem(self.plotFiber)
-        self.manager.fiberScene.addItem(self.plotButton)
-        self.manager.fiberScene.addItem(self.collisionFiber)
-        self.drawFiber()
+    def setProperties(self,cable,status,slit):
+        """
+        Update the cable/status/slit, eg from a new concentricities file. The
+          fiber must be redrawn afterwards.
+        """
+        self.cable = cable
+        self.status = status
+        self.slit = slit
+        self.setFiberPen()
 
     def setObject(self,objid):
         """
@@ -348,7 +356,7 @@ class Fiber:
 
         return xrot,yrot,vx,vy,points
 
-    def setFiber(self,pos=None):
+    def setFiber(self,pos=None,checkLegal=True):
         X,Y,vx,vy,polyPoints = self.getFiberGeometry(pos)
 
         path = QPainterPath()
@@ -363,9 +371,23 @@ class Fiber:
         path.cubicTo(X2[1],Y2[1],X2[2],Y2[2],X2[3],Y2[3])
 
         self.plotFiber.setPath(path)
-        M = self.collisionFiber
-        self.collisionFiber.setPolygon(QPolygonF(polyPoints))
 
+        #
+        # Simple tests of placing validity
+        #
+        self.inRange = self.psi<=self.manager.MAXBEND and self.ext<=self.manager.MAXEXTEND
+
+        #
+        # Check that the fiber and button don't collide with other fibers or
+        #  buttons (other than their own)
+        if checkLegal:
+            self.setLegal(self.inRange and self.manager.isLegal(self,pos))
+
+        # MWAW -- this is just for engineering tests of fiber positioning
+        self.plotButton.setToolTip("Fiber %s\nBend: %4.2f"%(self.fibid,self.psi))
+
+    def setLegal(self,legal):
+        self.legal = legal
         if self.active:
             self.plotFiber.setBrush(BlackBrush)
         else:
@@ -375,71 +397,16 @@ class Fiber:
                 self.plotFiber.setBrush(QColor("orange"))
             else:
                 self.plotFiber.setBrush(Qt.GlobalColor.cyan)
-
-        #
-        # Simple tests of placing validity
-        #
-        self.legal = True
-        if self.psi>self.manager.MAXBEND or self.ext>self.manager.MAXEXTEND:
-            self.legal = False
-            self.plotFiber.setBrush(RedBrush)
-
-        #
-        # Check that the fiber and button don't collide with other fibers or
-        #  buttons (other than their own)
-        lo = (self.fibid-1)%self.manager.NFIBERS
-        hi = (self.fibid+1)%self.manager.NFIBERS
-        if self.legal:
-            for obj in self.collisionFiber.collidingItems():
-                if obj==self.plotButton:
-                    continue
-                if not self.legalParkTest(obj,lo,hi):
-                    self.legal = False
-                    break
-                #if type(obj) in [Button,QGraphicsPolygonItem]:
-                #    self.legal = False
-        if self.legal:
-            for obj in self.plotButton.collidingItems():
-                if obj==self.collisionFiber:
-                    continue
-                if not self.legalParkTest(obj,lo,hi):
-                    self.legal = False
-                    break
-                #if type(obj) in [Button,QGraphicsPolygonItem]:
-                #    self.legal = False
         if not self.legal:
             self.plotFiber.setBrush(DarkRedBrush)
 
-        if self.cable=='F':
-            pen = self.plotFiber.pen()
-
-        # MWAW -- this is just for engineering tests of fiber positioning
-        self.plotButton.setToolTip("Fiber %s\nBend: %4.2f"%(self.fibid,self.psi))
-
-    def legalParkTest(self,obj,lo,hi):
-        objType = type(obj)
-        testFibers = self.manager.Fibers
-        if objType==Button:
-            if lo in testFibers and testFibers[lo].plotButton==obj:
-                return testFibers[lo].parked
-            if hi in testFibers and testFibers[hi].plotButton==obj:
-                return testFibers[hi].parked
-            return False
-        elif objType==QGraphicsPolygonItem:
-            if lo in testFibers and testFibers[lo].collisionFiber==obj:
-                return testFibers[lo].parked
-            if hi in testFibers and testFibers[hi].collisionFiber==obj:
-                return testFibers[hi].parked
-            return False
-        return True
-
-
-    def drawFiber(self):
+    def drawFiber(self,checkLegal=True):
         # Allow dragging of the fiber is it is active
         self.plotButton.setFlag(QGraphicsEllipseItem.GraphicsItemFlag.ItemIsMovable,self.active)
         pen = BlackButtonPen if self.active else GrayButtonPen
         self.plotButton.setPos(self.x,self.y)
-        self.setFiber()
+        self.manager.legalityTree = None
+        self.setFiber(checkLegal=checkLegal)
         if self.status!='A':
             self.plotButton.setBrush(GrayBrush)
         elif self.cable=='R':
@@ -464,7 +431,35 @@ class Fiber:
         self.x,self.y = x,y
         self.drawFiber()
 
-class StarMarker(QGraphicsPolygonItem):
+class Marker:
+    """
+    Mixin for the target markers. Markers are cached in device coordinates
+      and are drawn as plain squares, without antialiasing, when the level of
+      detail (device pixels per scene unit) is below SIMPLE_LOD.
+    """
+    DEFAULT_LOD = 1.
+    FAST_LOD = 2.
+    SIMPLE_LOD = DEFAULT_LOD
+
+    def initMarker(self,size,objid):
+        self.objid = objid
+        self.simpleRect = QRectF(-size/2,-size/2,size,size)
+        self.setCacheMode(QGraphicsItem.CacheMode.DeviceCoordinateCache)
+
+    def paint(self,painter,option,widget=None):
+        if option.levelOfDetailFromTransform(painter.worldTransform())<self.SIMPLE_LOD:
+            painter.setRenderHint(QPainter.RenderHint.Antialiasing,False)
+            painter.fillRect(self.simpleRect,self.brush())
+            return
+        super().paint(painter,option,widget)
+
+    def setAssigned(self,placed):
+        if placed:
+            self.setPen(PlacedPen)
+        else:
+            self.setPen(AssignedPen)
+
+class StarMarker(Marker,QGraphicsPolygonItem):
     """
     Star marker for FOPS targets.
     """
@@ -497,15 +492,9 @@ class StarMarker(QGraphicsPolygonItem):
         super(QGraphicsPolygonItem,self).__init__(QPolygonF([QPointF(_x*size,(offset-_y)*size) for _x,_y in points]))
         self.setBrush(YellowBrush)
         self.setPen(Pen)
-        self.objid = objid
+        self.initMarker(size*0.6,objid)
 
-    def setAssigned(self,placed):
-        if placed:
-            self.setPen(PlacedPen)
-        else:
-            self.setPen(AssignedPen)
-
-class SquareMarker(QGraphicsRectItem):
+class SquareMarker(Marker,QGraphicsRectItem):
     """
     Square marker for science targets.
     """
@@ -513,14 +502,9 @@ class SquareMarker(QGraphicsRectItem):
         super(QGraphicsRectItem,self).__init__(-size/2,-size/2,size,size)
         self.setBrush(ScienceBrush)
         self.setPen(Pen)
-        self.objid = objid
-    def setAssigned(self,placed):
-        if placed:
-            self.setPen(PlacedPen)
-        else:
-            self.setPen(AssignedPen)
+        self.initMarker(size,objid)
 
-class CircleMarker(QGraphicsEllipseItem):
+class CircleMarker(Marker,QGraphicsEllipseItem):
     """
     Circle marker for sky targets.
     """
@@ -528,10 +512,5 @@ class CircleMarker(QGraphicsEllipseItem):
         super(QGraphicsEllipseItem,self).__init__(-size/2,-size/2,size,size)
         self.setBrush(SkyBrush)
         self.setPen(Pen)
-        self.objid = objid
-    def setAssigned(self,placed):
-        if placed:
-            self.setPen(PlacedPen)
-        else:
-            self.setPen(AssignedPen)
+        self.initMarker(size,objid)
 
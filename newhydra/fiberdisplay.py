@@ -3,7 +3,8 @@ from PyQt6.QtWidgets import QGraphicsView,QGraphicsScene,QGraphicsEllipseItem, \
         QGraphicsPixmapItem
 from PyQt6.QtGui import QPainter,QBrush,QPen,QColor,QPainterPath,QPixmap,QImage,QNativeGestureEvent
 from PyQt6.QtCore import Qt,QTimer,QRectF,pyqtSlot
-from .displayobjects import Compass,FieldCompass,Fiber,StarMarker,SquareMarker,CircleMarker
+from .displayobjects import Compass,FieldCompass,Fiber,StarMarker,SquareMarker,CircleMarker,Marker
+import os
 
 class FiberDisplayView(QGraphicsView):
     """
@@ -66,42 +67,74 @@ class FiberDisplayScene(QGraphicsScene):
         x,y = self.manager.gui2hydra(x,y)
         self.main.xcoord_label.setText('x=%4d'%(x))
         self.main.ycoord_label.setText('y=%4d'%(y))
+        # The sky position is interpolated from a grid that is cached when
+        #  the field is loaded
+        if self.main.skyGrid is not None:
+            ra,dec = self.main.gridPlateToSky(x,y)
+            self.main.racoord_label.setText(self.main.ra2str(ra,':')[:11])
+            self.main.deccoord_label.setText(self.main.dec2str(dec,':')[:11])
 
 class FocalPlate(QGraphicsEllipseItem):
     """
     FocalPlate graphically represents the Hydra plate, but also shows the
       PS1 image of the field and implements a `move here/assign target'
       context menu.
+
+    The rotated and clipped image is cached as a pixmap at the resolution of
+      each zoom level, so repaints only need to blit it.
     """
+    # Largest cached image (pixels on a side) and number of zoom levels kept
+    MAXCACHESIZE = 4096
+    NCACHE = 4
+
     def __init__(self,manager,x0,y0,dx,dy):
         super(QGraphicsEllipseItem,self).__init__(x0,y0,dx,dy)
         self.manager = manager
         self.showPS1 = False
         self.angle = 0.
+        self.pixmapCache = {}
 
     def showImage(self,flag):
         self.showPS1 = flag
         self.update()
 
-    def setPS1Image(self,img):
-        import base64
-        self.pixmap = QPixmap()
-        data = base64.b64decode(img)
-        res = self.pixmap.loadFromData(data)
-        self.manager.main.ps1image_cbox.setEnabled(res)
-        self.update()
-
     def setPS1ImageDirect(self,img,angle):
-        #self.pixmap = QPixmap()
-        #img = img.convert("RGB")
+        """
+        img is a QImage decoded off the GUI thread; only the conversion to a
+          QPixmap is done here.
+        """
         self.angle = angle
-        data = img.tobytes("raw","RGB")
-        qim = QImage(data,img.size[0],img.size[1],QImage.Format.Format_RGB888)
-        self.pixmap = QPixmap.fromImage(qim)
+        self.pixmap = QPixmap.fromImage(img)
+        self.pixmapCache = {}
         self.manager.main.ps1image_cbox.setEnabled(True)
         self.manager.main.ps1image_cbox.setChecked(True)
         self.update()
 
+    def getCachedPixmap(self,scale):
+        """
+        The image rotated and clipped to the plate at the given scale
+          (device pixels per scene unit).
+        """
+        rect = self.rect()
+        scale = min(round(scale,3),self.MAXCACHESIZE/rect.width())
+        if scale not in self.pixmapCache:
+            if len(self.pixmapCache)>=self.NCACHE:
+                self.pixmapCache.pop(next(iter(self.pixmapCache)))
+            size = int(rect.width()*scale+0.5)
+            cache = QPixmap(size,size)
+            cache.fill(Qt.GlobalColor.transparent)
+            painter = QPainter(cache)
+            painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+            painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+            painter.scale(size/rect.width(),size/rect.height())
+            painter.translate(-rect.x(),-rect.y())
+            painter.setClipPath(self.shape())
+            painter.rotate(self.angle)
+            painter.drawPixmap(rect,self.pixmap,QRectF(self.pixmap.rect()))
+            painter.end()
+            self.pixmapCache[scale] = cache
+        return self.pixmapCache[scale]
+
     def contextMenuEvent(self,event):
         menu = QMenu()
         addskyposition = menu.addAction("Add Sky Position")
@@ -118,12 +151,12 @@ class FocalPlate(QGraphicsEllipseItem):
         ra,dec = self.manager.main.plateToSky(xx,yy)
         self.manager.main.addTarget(ra,dec)
 
-    def paint(self,*args):
-        super().paint(*args)
+    def paint(self,painter,option,widget=None):
+        super().paint(painter,option,widget)
         if self.showPS1:
-            args[0].setClipPath(self.shape())
-            args[0].rotate(self.angle)
-            args[0].drawPixmap(self.rect(),self.pixmap,QRectF(self.pixmap.rect()))
+            scale = option.levelOfDetailFromTransform(painter.worldTransform())
+            cache = self.getCachedPixmap(scale)
+            painter.drawPixmap(self.rect(),cache,QRectF(cache.rect()))
 
 class FiberDisplayManager:
     PLATESIZE = 420
@@ -139,6 +172,13 @@ class FiberDisplayManager:
         self.TargetDB = None
         self.tracking = False
 
+        # Spatial index of the fiber geometries for legality tests, and the
+        #  geometries keyed by fibid with the position they were made for
+        self.legalityTree = None
+        self.fiberGeometries = {}
+
+        self.fastRendering = os.environ.get("NEWHYDRA_FAST_RENDERING","0")!="0"
+
         self.HYDRAPLATE = parent.HydraConfig["PLATE"]
         self.SCALE = self.PLATESIZE/2/self.HYDRAPLATE
         self.FIBERHALFWIDTH = parent.HydraConfig["FIBERTUBE_HALFDIAMETER"]*self.SCALE
@@ -151,8 +191,12 @@ class FiberDisplayManager:
 
     def init(self,fiberInitDB):
         self.initialized = True
+        self.legalityTree = None
+        self.fiberGeometries = {}
         self.Fibers = {}
-        self.Targets = []
+        # Target markers and the state they were drawn from, keyed by objid
+        self.Targets = {}
+        self.TargetState = {}
 
         self.blinkingMarker = None
 
@@ -197,18 +241,102 @@ class FiberDisplayManager:
         self.BlinkTimer = QTimer(self.main)
         self.BlinkTimer.timeout.connect(self.blinkMarker)
 
+        self.setFastRendering(self.fastRendering)
 
-    def setImage(self,img):
-        self.plate.setPS1Image(img)
+    def setFastRendering(self,flag):
+        """
+        Fast rendering turns off antialiasing and draws the target markers
+          as simple glyphs unless zoomed in; it is the default if the
+          NEWHYDRA_FAST_RENDERING environment variable is set.
+        """
+        self.fastRendering = flag
+        self.main.fiberdisplay.setRenderHint(QPainter.RenderHint.Antialiasing,not flag)
+        Marker.SIMPLE_LOD = Marker.FAST_LOD if flag else Marker.DEFAULT_LOD
+        for M in self.Targets.values():
+            M.update()
 
-    #def setImageDirect(self,data):
-    #    img,angle = data
-    #    self.plate.setPS1ImageDirect(img,angle)
 
     def createFibers(self,fiberDB):
         for fibid,data in fiberDB.items():
             fibid = int(fibid)
             self.Fibers[fibid] = Fiber(data,self)
+        # Parked fibers can only overlap their neighbours, so the collision
+        #  tests (and shapely) are not needed until a fiber is placed
+        if all(fiber.parked for fiber in self.Fibers.values()):
+            for fiber in self.Fibers.values():
+                fiber.setLegal(fiber.inRange)
+        else:
+            self.updateLegality(self.Fibers.keys())
+
+    def getFiberGeometry(self,fiber,pos=None):
+        """
+        The fiber polygon in Hydra coordinates, as used by the optimizer.
+        """
+        if pos is None:
+            if fiber.parked:
+                return self.main.getFiber(fiber.fibid)
+            x,y = self.gui2hydra(fiber.x,fiber.y)
+        else:
+            x,y = self.gui2hydra(pos.x(),pos.y())
+        return self.main.getFiber(fiber.fibid,(x,y),limits=False)
+
+    def getLegalityIndex(self):
+        """
+        Build the STRtree of all fibers at their drawn positions; this is
+          reset whenever a fiber is redrawn, and only the geometries of
+          fibers that have moved are recomputed.
+        """
+        if self.legalityTree is None:
+            import shapely
+            geometries = []
+            for fibid,fiber in self.Fibers.items():
+                key = (fiber.x,fiber.y,fiber.parked)
+                if fibid not in self.fiberGeometries or self.fiberGeometries[fibid][0]!=key:
+                    self.fiberGeometries[fibid] = (key,self.getFiberGeometry(fiber))
+                geometries.append(self.fiberGeometries[fibid][1])
+            self.legalityFibers = list(self.Fibers.keys())
+            self.legalityGeometries = geometries
+            self.legalityTree = shapely.STRtree(geometries)
+        return self.legalityTree
+
+    def collisionAllowed(self,fibid,fibid2,moving=False):
+        """
+        A fiber may only touch itself or a neighbour when one of the two is
+          parked; a fiber that is being moved is not parked.
+        """
+        if fibid==fibid2:
+            return True
+        if fibid2 in ((fibid-1)%self.NFIBERS,(fibid+1)%self.NFIBERS):
+            if moving:
+                return self.Fibers[fibid2].parked
+            return self.Fibers[fibid].parked or self.Fibers[fibid2].parked
+        return False
+
+    def isLegal(self,fiber,pos=None):
+        tree = self.getLegalityIndex()
+        geo = self.getFiberGeometry(fiber,pos)
+        moving = pos is not None
+        for index in tree.query(geo,predicate="intersects"):
+            if not self.collisionAllowed(fiber.fibid,self.legalityFibers[index],moving):
+                return False
+        return True
+
+    def updateLegality(self,redrawn=()):
+        """
+        Test all fibers against each other in one query and update any fiber
+          whose legality has changed or that has been redrawn.
+        """
+        tree = self.getLegalityIndex()
+        fibids = self.legalityFibers
+        illegal = set()
+        for i,j in zip(*tree.query(self.legalityGeometries,predicate="intersects")):
+            if not self.collisionAllowed(fibids[i],fibids[j]):
+                illegal.add(fibids[i])
+        redrawn = set(redrawn)
+        for fibid,fiber in self.Fibers.items():
+            legal = fiber.inRange and fibid not in illegal
+            if legal!=fiber.legal or fibid in redrawn:
+                fiber.setLegal(legal)
 
     def hydra2gui(self,x,y):
         return x*self.SCALE+self.x0,-y*self.SCALE+self.y0
@@ -237,12 +365,9 @@ class FiberDisplayManager:
             for M in self.blinkingMarker:
                 M.setScale(1)
         self.blinkingMarker = None
-        for M in self.Targets:
-            if M.objid==state:
-                self.blinkingMarker = [M]
-                break
-        if self.blinkingMarker is None:
+        if state not in self.Targets:
             return
+        self.blinkingMarker = [self.Targets[state]]
         self.nMarkerBlinks = nblinks
         self.main.fiberdisplay.centerOn(self.blinkingMarker[0].pos())
         self.blinkingMarker[0].setScale(2)
@@ -278,6 +403,23 @@ class FiberDisplayManager:
             self.FiberDB = db
         self.updateFibers()
 
+    def updateFiberProperties(self,db):
+        """
+        Apply changes to the fiber cables and status; other changes are
+          applied by updateFibers().
+        """
+        changed = []
+        for fibid,data in db.items():
+            fiber = self.Fibers.get(int(fibid))
+            if fiber is None:
+                continue
+            if (fiber.cable,fiber.status,fiber.slit)!=(data["cable"],data["status"],data["slit"]):
+                fiber.setProperties(data["cable"],data["status"],data["slit"])
+                fiber.drawFiber(False)
+                changed.append(fiber.fibid)
+        if len(changed):
+            self.updateLegality(changed)
+
     def updateTargetDB(self,db,angle=None):
         self.TargetDB = db
         if angle is not None:
@@ -286,50 +428,88 @@ class FiberDisplayManager:
         self.updateTargets()
 
     def updateFibers(self):
+        """
+        Apply the fiber database to the display. All changes to a fiber are
+          collected first so that each changed fiber is redrawn once, and the
+          view is only repainted after the whole batch.
+        """
         if self.FiberDB is None:
             return
+        changed = []
         for fibid,data in self.FiberDB.items():
-            fibid = int(fibid)
-            self.Fibers[fibid].stowed = data["stowed"]
-            self.Fibers[fibid].parked = data["parked"]
-            # NB: This could end up drawing the fibers multiple times
-            if data["active"]!=self.Fibers[fibid].active:
-                self.Fibers[fibid].setActiveStatus(data["active"])
-            if data["queued"]!=self.Fibers[fibid].queued:
-                self.Fibers[fibid].setQueueStatus(data["queued"])
-            if data["object"]!=self.Fibers[fibid].objid:
-                self.Fibers[fibid].setObject(data["object"])
+            fiber = self.Fibers[int(fibid)]
+            fiber.stowed = data["stowed"]
+            fiber.parked = data["parked"]
+            redraw = False
+            if data["active"]!=fiber.active:
+                fiber.active = data["active"]
+                redraw = True
+            if data["queued"]!=fiber.queued:
+                fiber.queued = data["queued"]
+                redraw = True
+            if data["object"]!=fiber.objid:
+                fiber.setObject(data["object"])
             x,y = self.hydra2gui(data['x'],data['y'])
-            if self.Fibers[fibid].x!=x or self.Fibers[fibid].y!=y:
-                self.Fibers[fibid].updateXY(x,y)
+            if fiber.x!=x or fiber.y!=y:
+                fiber.x,fiber.y = x,y
+                redraw = True
+            if redraw:
+                changed.append(fiber)
+        if len(changed)==0:
+            return
+        view = self.main.fiberdisplay
+        view.setUpdatesEnabled(False)
+        for fiber in changed:
+            fiber.drawFiber(False)
+        self.updateLegality([fiber.fibid for fiber in changed])
+        view.setUpdatesEnabled(True)
+
+    def createMarker(self,objid,objType):
+        if objType=='F':
+            return StarMarker(5,objid)
+        elif objType=='S':
+            return CircleMarker(3,objid)
+        return SquareMarker(3,objid)
 
     def updateTargets(self):
-        # Remove the old targets
-        while len(self.Targets):
-            self.fiberScene.removeItem(self.Targets.pop())
-        # Add the new targets
+        """
+        Only markers for objects that have changed are touched; new objects
+          get a marker, objects that have gone are removed, and a change of
+          type replaces the marker.
+        """
         if self.TargetDB is None:
             return
+        opacity = 0.5 if self.plate.showPS1 else 1
+        visible = {StarMarker:self.main.showfops_cbox.isChecked(),
+                   CircleMarker:self.main.showskys_cbox.isChecked(),
+                   SquareMarker:self.main.showtargets_cbox.isChecked()}
+        # Remove the targets that are no longer in the catalog
+        for objid in [_ for _ in self.Targets if _ not in self.TargetDB]:
+            self.fiberScene.removeItem(self.Targets.pop(objid))
+            del self.TargetState[objid]
         for objid,data in self.TargetDB.items():
-            x,y = self.hydra2gui(data['x'],data['y'])
-            if data["type"]=='F':
-                M = StarMarker(5,objid)
-            elif data["type"]=='S':
-                M = CircleMarker(3,objid)
-            else:
-                M = SquareMarker(3,objid)
-            M.setPos(x,y)
-            if self.plate.showPS1:
-                M.setOpacity(0.5)
-            if data["fibid"] is not None:
-                M.setToolTip("Objid: %s (Fiber %s)\n%s"%(objid,data["fibid"],data["name"].strip()))
-            else:
-                M.setToolTip("Objid: %s\n%s"%(objid,data["name"].strip()))
-            self.Targets.append(M)
-            self.fiberScene.addItem(self.Targets[-1])
-        self.targetsShowHide()
-        self.fopsShowHide()
-        self.skysShowHide()
+            state = (data["type"],data['x'],data['y'],data["fibid"],data["name"])
+            old = self.TargetState.get(objid)
+            if state==old:
+                continue
+            if old is None or old[0]!=state[0]:
+                if old is not None:
+                    self.fiberScene.removeItem(self.Targets[objid])
+                M = self.createMarker(objid,data["type"])
+                M.setOpacity(opacity)
+                M.setVisible(visible[type(M)])
+                self.Targets[objid] = M
+                self.fiberScene.addItem(M)
+                old = None
+            M = self.Targets[objid]
+            if old is None or old[1:3]!=state[1:3]:
+                M.setPos(*self.hydra2gui(data['x'],data['y']))
+            if old is None or old[3:]!=state[3:]:
+                if data["fibid"] is not None:
+                    M.setToolTip("Objid: %s (Fiber %s)\n%s"%(objid,data["fibid"],data["name"].strip()))
+                else:
+                    M.setToolTip("Objid: %s\n%s"%(objid,data["name"].strip()))
+            self.TargetState[objid] = state
         self.TargetDB = None
 
     def doAcquire(self): # OBSOLETE
@@ -339,7 +519,7 @@ class FiberDisplayManager:
         if self.main.hideFibersAndObjects.isChecked():
             for cbox in cboxes:
                 cbox.setEnabled(False)
-            for target in self.Targets:
+            for target in self.Targets.values():
                 target.hide()
             for fiber in self.Fibers:
                 if self.Fibers[fiber].cable!='F':
@@ -347,7 +527,7 @@ class FiberDisplayManager:
         else:
             for cbox in cboxes:
                 cbox.setEnabled(True)
-            for target in self.Targets:
+            for target in self.Targets.values():
                 target.show()
             for fiber in self.Fibers:
                 self.Fibers[fiber].setVisible(True)
@@ -363,7 +543,7 @@ class FiberDisplayManager:
         self.markerShowHide(self.main.showskys_cbox.isChecked(),CircleMarker)
 
     def markerShowHide(self,show,marker):
-        for target in self.Targets:
+        for target in self.Targets.values():
             if type(target)==marker:
                 if show:
                     target.show()
@@ -374,5 +554,5 @@ class FiberDisplayManager:
         state = self.main.ps1image_cbox.isChecked()
         self.plate.showImage(state)
         opacity = 0.5 if state else 1
-        for target in self.Targets:
+        for target in self.Targets.values():
             target.setOpacity(opacity)
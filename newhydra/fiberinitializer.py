@@ -1,66 +1,113 @@
 from math import pi,cos,sin
-import requests
-import os
+from PyQt6.QtCore import pyqtSlot,pyqtSignal
+import os,json
+from .worker import Worker
 
 class FiberInitializer:
+    CONCENTRICITIES_URL = "https://www.wiyn.org/hydraConcentricities.json"
+    CONCENTRICITIES_TIMEOUT = 10
+
+    concentricitySignal = pyqtSignal(str)
 
     def getConcentricities(self):
-        # First try to download the most recent version
-        URL = "https://www.wiyn.org/hydraConcentricities.json"
+        """
+        Set up the fibers from the cached (or packaged) concentricities file
+          so that the UI can start straight away; refreshConcentricities()
+          then fetches the latest version in the background.
+        """
+        self.concentricities = None
+        # First look in the cache
+        filename = self.cachedir+"/hydraConcentricities.json"
+        confile = None
+        if os.path.isfile(filename):
+            try:
+                confile = open(filename).read()
+                self.printMessage("Using the concentricities file:",filename)
+            except:
+                self.printError("Could not open cached concentricities file:",filename)
+                confile = None
+        # If that wasn't successful look in install directory
+        if not confile:
+            try:
+                from importlib_resources import files
+            except ImportError:
+                from importlib.resources import files
+            cfile = files("newhydra").joinpath("data/hydraConcentricities.json")
+            try:
+                confile = cfile.read_text()
+                self.printMessage("Using the package concentricities file:",cfile.as_posix())
+            except:
+                self.printError("Could not open package concentricities file:",cfile.as_posix())
+                return
+        if self.processConcentricityFile(confile):
+            self.concentricities = confile
+
+    def refreshConcentricities(self):
+        self.concentricitySignal.connect(self.updateConcentricities)
+        worker = Worker(self.fetchConcentricities)
+        self.threadPool.start(worker)
+
+    def fetchConcentricities(self):
+        import requests
         try:
-            result = requests.get(URL)
+            result = requests.get(self.CONCENTRICITIES_URL,timeout=self.CONCENTRICITIES_TIMEOUT)
         except:
             result = None
         if result:
-            # If we have successfully retrieved the file, update the cache
-            confile = result.text
-            ofile = open(self.cachedir+"/hydraConcentricities.json",'w')
+            self.concentricitySignal.emit(result.text)
+        else:
+            self.printMessageSignal.emit("Could not fetch the most recent concentricities file from WIYN; the local copy will be used.")
+
+    @pyqtSlot(str)
+    def updateConcentricities(self,confile):
+        """
+        Apply a newly downloaded concentricities file. The fiber cables and
+          status are updated in place; if a field is loaded and its active
+          fibers have changed (eg, a fiber has broken), the placement is
+          reset for the new fibers.
+        """
+        if confile==self.concentricities:
+            return
+        FiberDB = self.parseConcentricityFile(confile)
+        if FiberDB is None:
+            return
+        # If we have successfully retrieved the file, update the cache
+        with open(self.cachedir+"/hydraConcentricities.json",'w') as ofile:
             ofile.write(confile)
-            ofile.close()
+        self.concentricities = confile
+        fieldLoaded = bool(getattr(self,"catalog",None))
+        changed = False
+        for fibid,data in FiberDB.items():
+            if fibid not in self.FiberDB:
+                continue
+            old = self.FiberDB[fibid]
+            for key in ("cable","status","slit"):
+                old[key] = data[key]
+            # As for the field's cable in applyCatalog()
+            if fieldLoaded and data["cable"]!='F':
+                active = data["status"]=="A" and data["cable"]==self.CABLE[0]
+            else:
+                active = data["active"]
+            changed |= active!=old["active"]
+            old["active"] = active
+        self.DisplayManager.updateFiberProperties(self.FiberDB)
+        self.updateFiberStatus(self.FiberDB)
+        if fieldLoaded and changed:
+            self.resetActiveFibers()
+            self.printMessage("The concentricities file has been updated; the placement has been reset for the working fibers.")
         else:
-            self.printError("Could not fetch the most recent concentricities file from WIYN; a local copy will be used.")
-            # First look in the cache
-            filename = self.cachedir+"/hydraConcentricities.json"
-            confile = None
-            if os.path.isfile(filename):
-                try:
-                    confile = open(filename).read()
-                    self.printMessage("Using the concentricities file:",filename)
-                except:
-                    self.printError("Could not open cached concentricities file:",filename)
-                    confile = None
-            # If that wasn't successful look in install directory
-            if not confile:
-                try:
-                    from importlib_resources import files
-                except ImportError:
-                    from importlib.resources import files
-                cfile = files("newhydra").joinpath("data/hydraConcentricities.json")
-                try:
-                    confile = cfile.read_text()
-                    self.printMessage("Using the package concentricities file:",cfile.as_posix())
-                except:
-                    self.printError("Could not open package concentricities file:",cfile.as_posix())
-                    return
-                """
-                    confile = None
-                if confile is None:
-                    filename = QFileDialog.getOpenFileName(self,"Select Concentricities File",self.cachedir,"JSON (*.json);; All files (*)",options=QFileDialog.Option.DontUseNativeDialog)[0]
-                    if filename!="":
-                        self.printMessage("Using file "+filename+" for fiber information")
-                        try:
-                            confile = open(filename).read()
-                        except:
-                            self.printError("Could not open file:",filename)
-                            return
-                    else:
-                        return
-                """
-        self.processConcentricityFile(confile)
+            self.printMessage("Updated the concentricities from WIYN.")
 
     def processConcentricityFile(self,concdata):
+        FiberDB = self.parseConcentricityFile(concdata)
+        if FiberDB is None:
+            return False
+        self.FiberDB = FiberDB
+        return True
+
+    def parseConcentricityFile(self,concdata):
         try:
-            concen = eval(concdata)
+            concen = json.loads(concdata)
         except:
             self.printError("Could not parse concentricities file.")
             return
@@ -103,7 +150,7 @@ class FiberInitializer:
                               "queued":False,
                               "parked":True,
                               "stowed":False}
-        self.FiberDB = FiberDB
+        return FiberDB
 
     def processConcentricityFileOldFormat(self,confile):
         FiberDB = {}
@@ -0,0 +1,127 @@
+from PyQt6.QtCore import Qt,QAbstractTableModel,QSortFilterProxyModel,QModelIndex
+from PyQt6.QtGui import QColor,QFont
+
+"""
+Model/view classes for the target table.
+"""
+
+ItemDataRole = Qt.ItemDataRole
+
+HeaderFont = QFont()
+HeaderFont.setPointSize(10)
+
+FopsColor = QColor("lightYellow")
+SkyColor = QColor(200,200,255)
+ScienceColor = QColor(200,255,200)
+AssignedColor = QColor("pink")
+
+
+class FiberTableModel(QAbstractTableModel):
+    """
+    Table model over the target catalog. Each row is kept as the tuple of
+      strings (and color) that is displayed, so that updating the catalog
+      only signals the rows that have actually changed.
+    """
+    COLUMNS = ("ID","Name","Mag","RA","Dec","Fib","Slit")
+
+    def __init__(self,parent=None):
+        super().__init__(parent)
+        self.objids = []
+        self.rows = []
+
+    def rowCount(self,parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def columnCount(self,parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.COLUMNS)
+
+    def headerData(self,section,orientation,role=ItemDataRole.DisplayRole):
+        if orientation==Qt.Orientation.Horizontal:
+            if role==ItemDataRole.DisplayRole:
+                return self.COLUMNS[section]
+            if role==ItemDataRole.FontRole:
+                return HeaderFont
+        return super().headerData(section,orientation,role)
+
+    def data(self,index,role=ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role==ItemDataRole.DisplayRole:
+            return row[index.column()]
+        if role==ItemDataRole.BackgroundRole:
+            return row[-1]
+        return None
+
+    def flags(self,index):
+        return Qt.ItemFlag.ItemIsEnabled|Qt.ItemFlag.ItemIsSelectable
+
+    def makeRow(self,objid,data):
+        # Color-code the rows according to target type, or pink if the
+        #  target is assigned to a fiber
+        if data["type"]=='F':
+            C = FopsColor
+        elif data["type"]=='S':
+            C = SkyColor
+        else:
+            C = ScienceColor
+        fibid = ""
+        slitid = ""
+        if data["fibid"] is not None:
+            fibid = "{:3d}".format(data["fibid"])
+            if data["slitid"]>0:
+                slitid = "{:3d}".format(data["slitid"])
+            C = AssignedColor
+        return ("{:4d}".format(int(objid)),data["name"],data["mag"],data["ra"],data["dec"],fibid,slitid,C)
+
+    def setCatalog(self,catalog):
+        """
+        Update the table from the catalog. If the objects are unchanged (or
+          new objects have been appended) only the changed rows are
+          signalled; otherwise the model is reset.
+        """
+        objids = list(catalog.keys())
+        rows = [self.makeRow(objid,catalog[objid]) for objid in objids]
+        N = len(self.objids)
+        if objids[:N]!=self.objids:
+            self.beginResetModel()
+            self.objids = objids
+            self.rows = rows
+            self.endResetModel()
+            return
+        last = len(self.COLUMNS)-1
+        start = None
+        for i in range(N+1):
+            if i<N and rows[i]!=self.rows[i]:
+                self.rows[i] = rows[i]
+                if start is None:
+                    start = i
+            elif start is not None:
+                self.dataChanged.emit(self.index(start,0),self.index(i-1,last))
+                start = None
+        if len(objids)>N:
+            self.beginInsertRows(QModelIndex(),N,len(objids)-1)
+            self.objids = objids
+            self.rows += rows[N:]
+            self.endInsertRows()
+
+    def getObject(self,row):
+        return self.objids[row]
+
+
+class FiberTableProxy(QSortFilterProxyModel):
+    """
+    Sorting proxy that always puts targets without a fiber (or slit) at the
+      bottom when sorting by the fiber/slit columns.
+    """
+    def lessThan(self,left,right):
+        L = self.sourceModel().data(left)
+        R = self.sourceModel().data(right)
+        if left.column()>=5 and (L=="")!=(R==""):
+            # Qt reverses the comparison for descending sorts
+            return (L=="")==(self.sortOrder()==Qt.SortOrder.DescendingOrder)
+        return L<R
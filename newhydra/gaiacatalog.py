@@ -0,0 +1,214 @@
+"""
+A local copy of the bright Gaia DR3 stars used for FOPS selection.
+
+The catalog is split into declination zones. Each zone is a NumPy file of
+  G<14 stars sorted by RA, so a cone search only has to memory-map the zones
+  that overlap the cone and bisect them in RA. The sky regions that have been
+  downloaded are recorded in an index file; a field is only served from the
+  local catalog if its whole search cone has been downloaded.
+
+Build the catalog with, eg.,
+    NeWHydra-gaia myfield.hydra 150.0,+30.0 --radius 1.5
+"""
+import os,json,time
+from math import pi,cos,sin,asin,floor
+import numpy as np
+
+GAIA_DTYPE = np.dtype([("source_id","i8"),
+                       ("ra","f8"),
+                       ("dec","f8"),
+                       ("pmra","f8"),
+                       ("pmdec","f8"),
+                       ("phot_g_mean_mag","f4"),
+                       ("bp_rp","f4")])
+GAIA_COLUMNS = "source_id,ra,dec,pmra,pmdec,phot_g_mean_mag,bp_rp"
+GAIA_GMAX = 14
+ZONE_HEIGHT = 1.
+
+def getGaiaDir():
+    from platformdirs import user_data_dir
+    return os.path.join(user_data_dir("newhydra"),"gaia")
+
+def angularDistance(ra1,dec1,ra2,dec2):
+    """
+    Great-circle distance in degrees (haversine); inputs may be arrays.
+    """
+    d2r = pi/180
+    sdec = np.sin((dec2-dec1)*d2r/2)
+    sra = np.sin((ra2-ra1)*d2r/2)
+    h = sdec*sdec+np.cos(dec1*d2r)*np.cos(dec2*d2r)*sra*sra
+    return 2*np.arcsin(np.sqrt(np.clip(h,0,1)))/d2r
+
+def tableToArray(table):
+    """
+    Convert an astropy table returned by the Gaia archive to a GAIA_DTYPE
+      array; masked (null) values become NaN.
+    """
+    stars = np.zeros(len(table),GAIA_DTYPE)
+    for name in GAIA_DTYPE.names:
+        col = table[name]
+        if hasattr(col,"filled"):
+            col = col.filled(np.nan) if name!="source_id" else col.filled(-1)
+        stars[name] = col
+    return stars
+
+
+class LocalGaiaCatalog:
+    def __init__(self,directory=None):
+        if directory is None:
+            directory = getGaiaDir()
+        self.directory = directory
+        self.indexFile = os.path.join(directory,"index.json")
+        self.regions = []
+        self.zones = {}
+        if os.path.isfile(self.indexFile):
+            try:
+                with open(self.indexFile) as F:
+                    index = json.load(F)
+                if index["zone"]==ZONE_HEIGHT:
+                    self.regions = index["regions"]
+            except:
+                self.regions = []
+
+    def zoneFile(self,zone):
+        return os.path.join(self.directory,"zone_%03d.npy"%(zone))
+
+    def getZone(self,zone):
+        if zone not in self.zones:
+            filename = self.zoneFile(zone)
+            if os.path.isfile(filename):
+                self.zones[zone] = np.load(filename,mmap_mode='r')
+            else:
+                self.zones[zone] = np.zeros(0,GAIA_DTYPE)
+        return self.zones[zone]
+
+    def zoneRange(self,dec,radius):
+        nzones = int(round(180/ZONE_HEIGHT))
+        lo = int(floor((max(dec-radius,-90)+90)/ZONE_HEIGHT))
+        hi = int(floor((min(dec+radius,90)+90)/ZONE_HEIGHT))
+        return range(max(lo,0),min(hi,nzones-1)+1)
+
+    def covers(self,ra,dec,radius):
+        """
+        Is the cone entirely contained within a downloaded region?
+        """
+        for ra0,dec0,radius0 in self.regions:
+            if angularDistance(ra,dec,ra0,dec0)+radius<=radius0:
+                return True
+        return False
+
+    def coneSearch(self,ra,dec,radius):
+        """
+        Return all catalog stars within radius (degrees) of ra,dec.
+        """
+        ra = ra%360
+        result = []
+        for zone in self.zoneRange(dec,radius):
+            stars = self.getZone(zone)
+            if len(stars)==0:
+                continue
+            # Bound the RA range using the zone edge closest to the pole
+            zdec = max(abs(zone*ZONE_HEIGHT-90),abs((zone+1)*ZONE_HEIGHT-90))
+            if abs(dec)+radius>=90 or sin(radius*pi/180)>=cos(zdec*pi/180):
+                ranges = [(0,len(stars))]
+            else:
+                dra = asin(sin(radius*pi/180)/cos(zdec*pi/180))*180/pi
+                lo,hi = ra-dra,ra+dra
+                RA = stars["ra"]
+                if lo<0:
+                    ranges = [(np.searchsorted(RA,lo+360),len(stars)),
+                              (0,np.searchsorted(RA,hi,side="right"))]
+                elif hi>=360:
+                    ranges = [(np.searchsorted(RA,lo),len(stars)),
+                              (0,np.searchsorted(RA,hi-360,side="right"))]
+                else:
+                    ranges = [(np.searchsorted(RA,lo),np.searchsorted(RA,hi,side="right"))]
+            for start,end in ranges:
+                if end<=start:
+                    continue
+                chunk = stars[start:end]
+                keep = angularDistance(ra,dec,chunk["ra"],chunk["dec"])<radius
+                result.append(np.array(chunk[keep]))
+        if len(result)==0:
+            return np.zeros(0,GAIA_DTYPE)
+        return np.concatenate(result)
+
+    def addStars(self,stars):
+        """
+        Merge stars into the zone files, replacing duplicate sources.
+        """
+        os.makedirs(self.directory,exist_ok=True)
+        zones = np.floor((stars["dec"]+90)/ZONE_HEIGHT).astype(int)
+        zones = np.clip(zones,0,int(round(180/ZONE_HEIGHT))-1)
+        for zone in np.unique(zones):
+            new = stars[zones==zone]
+            old = np.array(self.getZone(zone))
+            merged = np.concatenate([new,old[~np.isin(old["source_id"],new["source_id"])]])
+            merged = merged[np.argsort(merged["ra"],kind="stable")]
+            # Drop the memory map before overwriting the file
+            self.zones.pop(zone,None)
+            np.save(self.zoneFile(zone),merged)
+
+    def addRegion(self,ra,dec,radius,stars=None):
+        """
+        Download all G<14 stars with proper motions within a cone (unless the
+          stars are provided) and record the cone as covered.
+        """
+        if stars is None:
+            from astroquery.gaia import Gaia
+            query = "SELECT {} from gaiadr3.gaia_source WHERE DISTANCE({:f},{:f},ra,dec)<{:f} and pmra is not null and phot_g_mean_mag<{} and phot_g_mean_mag is not null".format(GAIA_COLUMNS,ra,dec,radius,GAIA_GMAX)
+            job = Gaia.launch_job_async(query)
+            stars = tableToArray(job.get_results())
+        self.addStars(stars)
+        self.regions.append([ra%360,dec,radius])
+        with open(self.indexFile,'w') as F:
+            json.dump({"zone":ZONE_HEIGHT,"regions":self.regions},F)
+        return len(stars)
+
+
+def parseTarget(target,radius):
+    """
+    A build target is either a Hydra field file, from which the RA/DEC
+      header keywords are used, or an `ra,dec' pair in degrees.
+    """
+    if os.path.isfile(target):
+        ra = dec = None
+        for line in open(target):
+            key,_,value = line.partition(':')
+            if key=="RA":
+                h,m,s = [float(_) for _ in value.replace(':',' ').split()]
+                ra = (h+m/60+s/3600)*15
+            elif key=="DEC":
+                d,m,s = [float(_) for _ in value.replace(':',' ').split()]
+                sign = -1 if value.strip()[0]=='-' else 1
+                dec = sign*(abs(d)+m/60+s/3600)
+        if ra is None or dec is None:
+            raise ValueError("No RA/DEC keywords in "+target)
+        return ra,dec,radius
+    ra,dec = [float(_) for _ in target.split(',')]
+    return ra,dec,radius
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Download Gaia DR3 stars (G<14) for offline FOPS selection.")
+    parser.add_argument("targets",nargs="+",help="Hydra field files or ra,dec pairs (degrees)")
+    parser.add_argument("--radius",type=float,default=1.,help="Cone radius in degrees (default: 1)")
+    parser.add_argument("--dir",default=None,help="Catalog directory (default: %s)"%(getGaiaDir()))
+    args = parser.parse_args()
+
+    catalog = LocalGaiaCatalog(args.dir)
+    for target in args.targets:
+        ra,dec,radius = parseTarget(target,args.radius)
+        if catalog.covers(ra,dec,radius):
+            print("{:.4f},{:+.4f} is already in the local catalog".format(ra,dec))
+            continue
+        t = time.time()
+        try:
+            N = catalog.addRegion(ra,dec,radius)
+        except Exception as err:
+            print("Could not query the Gaia catalog for {:.4f},{:+.4f}: {}".format(ra,dec,err))
+            continue
+        print("Added {} stars around {:.4f},{:+.4f} in {:.1f}s".format(N,ra,dec,time.time()-t))
+
+if __name__=="__main__":
+    main()
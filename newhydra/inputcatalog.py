@@ -3,12 +3,12 @@ from PyQt6 import QtCore
 from PyQt6.QtCore import pyqtSlot,pyqtSignal,QTimer
 from pathlib import Path
 from math import pi,cos
-import os,pickle,datetime,time
-import shapely
-from astropy.wcs import WCS
-from astroquery.gaia import Gaia
-from astropy.time import Time
+import os,pickle,datetime,time,hashlib
+import numpy as np
 from .worker import Worker
+from .gaiacatalog import LocalGaiaCatalog,GAIA_COLUMNS,tableToArray
+from .fibertable import FiberTableModel,FiberTableProxy
+from .profiling import profiled
 
 
 HOME = str(Path.home())
@@ -18,13 +18,27 @@ class CatalogManager:
     # Required keywords
     headerKeywords = ["FIELDNAME","RA","DEC","LST","EXPTIME","WAVELENGTH","CABLE","OBSDATE"]
     # These keywords are optional
-    headerKeywords += ["PA","GUIDEWAVELENGTH","MINFOPS","FOPSWEIGHT","BP-RP_MIN","BP-RP_MAX","GAIA_RANGE"]
+    headerKeywords += ["PA","GUIDEWAVELENGTH","MINFOPS","FOPSWEIGHT","BP-RP_MIN","BP-RP_MAX","GAIA_RANGE","PMEPOCH"]
+    # With PMEPOCH set, target lines have PMRA/PMDEC (mas/yr) columns after
+    #  the weight, which shifts the type/fiber columns by this much
+    PMCOLUMNS = 18
+
+    # Time-to-live (in days) of cached Gaia queries, unless set by
+    #  NEWHYDRA_GAIA_CACHE_TTL
+    GAIA_CACHE_TTL = 30.
+
+    catalog = None
 
     fiberSignal = pyqtSignal(dict)
     targetSignal = pyqtSignal(dict)
+    cableSignal = pyqtSignal(str)
     imageSignal = pyqtSignal(object,float)
 
     def setupTable(self):
+        self.FiberTableModel = FiberTableModel(self)
+        self.FiberTableProxy = FiberTableProxy(self)
+        self.FiberTableProxy.setSourceModel(self.FiberTableModel)
+        self.FiberTable.setModel(self.FiberTableProxy)
         colHead = self.FiberTable.horizontalHeader()
         for i in range(5):
             colHead.setSectionResizeMode(i,QHeaderView.ResizeMode.ResizeToContents)
@@ -45,6 +59,7 @@ class CatalogManager:
             #  chance to close
             QTimer.singleShot(150,lambda: self.processTargetFile(filename))
 
+    @profiled()
     def processHeader(self,header):
         def reportMissing(key):
             self.printError("Missing required keyword:",key)
@@ -191,6 +206,13 @@ class CatalogManager:
                 badHeaders.append("GAIA_RANGE")
         else:
             self.GAIA_RANGE = None
+        if header["PMEPOCH"]:
+            try:
+                self.PMEPOCH = float(header["PMEPOCH"])
+            except:
+                badHeaders.append("PMEPOCH")
+        else:
+            self.PMEPOCH = None
         for key in badHeaders:
             self.printError("Could not parse header {}: {}".format(key,header[key]))
             OK = False
@@ -200,9 +222,11 @@ class CatalogManager:
         # Now apply header info where necessary
         self.setABCoefficients()
         self.REFRA,self.REFDEC = self.refractCoords(self.FIELDRA*pi/180,self.FIELDDEC*pi/180)
+        from astropy.wcs import WCS
         self.WCS = WCS({"CRVAL1":self.REFRA*180/pi,"CRVAL2":self.REFDEC*180/pi,
                         "CD1_1":1,"CD1_2":0,"CD2_1":0,"CD2_2":1.,
                         "CTYPE1":"RA---TAN","CTYPE2":"DEC--TAN"})
+        self.setSkyGrid()
         FiberDB = {}
         # Reset fiber data and make the CABLE fibers active
         for fibid,data in self.FiberDB.items():
@@ -221,7 +245,9 @@ class CatalogManager:
         return header
 
 
+    @profiled()
     def processTargetFile(self,filename):
+        start = time.perf_counter()
         try:
             lines = open(filename).readlines()
         except:
@@ -277,19 +303,18 @@ class CatalogManager:
                 weight = int(line[68:73])
                 fibid = None
                 slitid = None
+                offset = 0
+                if self.PMEPOCH is not None:
+                    # PMRA includes the cos(Dec) term, as in Gaia
+                    pmra = float(line[74:82])
+                    pmdec = float(line[83:91])
+                    offset = self.PMCOLUMNS
                 if previousAssignments is not None:
-                    objType = line[74]
+                    objType = line[74+offset]
             except:
                 self.printError("Could not parse the line: ",line)
                 continue
-            xc,yc,xs,ys = self.skyToPlate(ra,dec)
-            if objType=="F":
-                x,y = xc,yc
-            else:
-                x,y = xs,ys
-            #if x*x+y*y>self.HydraConfig["PLATE"]**2:
-            #    self.printError("Object is not on the plate (x={},y={}): {}".format(x,y,line))
-            #    continue
+            # The plate positions are set below for the whole catalog
             catalog[objid] = {"name":name,
                               "mag":mag,
                               "RADeg":ra,
@@ -300,13 +325,16 @@ class CatalogManager:
                               "dec":decStr,
                               "fibid":fibid,
                               "slitid":slitid,
-                              "x":x,
-                              "y":y}
+                              "x":None,
+                              "y":None}
+            if self.PMEPOCH is not None:
+                catalog[objid]["pmra"] = pmra
+                catalog[objid]["pmdec"] = pmdec
             if previousAssignments is not None:
                 try:
-                    fibid = line[76:79].strip()
+                    fibid = line[76+offset:79+offset].strip()
                     if self.FiberDB[fibid]["active"]:
-                        flag = len(line)>79 and line[79]=='*'
+                        flag = len(line)>79+offset and line[79+offset]=='*'
                         previousAssignments[objid] = [fibid,flag]
                     else:
                         self.printError("Could not assign fiber {} to object {} because the fiber is not active.".format(fibid,name))
@@ -315,113 +343,211 @@ class CatalogManager:
         if len(catalog)==0:
             self.printError("No valid objects provided.")
             return
+        self.setPlatePositions(catalog)
         catalog = self.addGaiaFOPs(header,catalog)
         self.previousAssignments = previousAssignments
         self.applyCatalog(header,catalog)
+        self.writeStartupProfile("field",time.perf_counter()-start)
+        self.reportProfile()
 
+    @profiled()
     def addGaiaFOPs(self,header,catalog):
         """
-        Query the Gaia DR3 source catalog for all stars with magnitudes
-          10 < G < 12, increasing the range by 0.25mag in the event that
-          there are not enough stars (eg., 10.25 < G < 12.25).
+        Query the Gaia DR3 source catalog (the local copy if it covers the
+          field) for all stars with magnitudes 10 < G < 12, increasing the
+          range by 0.25mag in the event that there are not enough stars
+          (eg., 10.25 < G < 12.25).
 
           Stars must have valid magnitudes and proper motions, and
           corrections for the latter are applied using the OBSDATE keyword
           and the Gaia epoch of 2016.0.
         """
-        epoch = Time(self.DATE,format="datetime").decimalyear
-        years = epoch-2016.0
-
-        t = time.time()
-        query = "SELECT source_id,ra,dec,pmra,pmdec,phot_g_mean_mag from gaiadr3.gaia_source WHERE DISTANCE(%f,%f,ra,dec)<0.5 and pmra is not null and phot_g_mean_mag<14 and phot_g_mean_mag is not null"%(self.FIELDRA,self.FIELDDEC)
-        if self.BPRP_MAX is not None and self.BPRP_MIN is not None:
-            query += " and ((phot_bp_mean_mag-phot_rp_mean_mag) between {} and {})".format(self.BPRP_MIN,self.BPRP_MAX)
-        elif self.BPRP_MAX is not None:
-            query += " and (phot_bp_mean_mag-phot_rp_mean_mag)<{}".format(self.BPRP_MAX)
-        elif self.BPRP_MIN is not None:
-            query += " and (phot_bp_mean_mag-phot_rp_mean_mag)>{}".format(self.BPRP_MIN)
-        try:
-            job = Gaia.launch_job(query)
-            res = job.get_results()
-            self.printMessage("Obtained {} stars from Gaia DR3 with G<14 in {:.2f}s".format(len(res),time.time()-t))
-        except:
-            self.printError("Could not query the Gaia catalog; either the archive is temporarily down or there is a problem with internet access.")
+        stars = self.getGaiaStars()
+        if stars is None:
             return catalog
-        # First we count the results
-        Nstars = 0
+        mags = stars["phot_g_mean_mag"].astype(float)
         if self.GAIA_RANGE is None:
-            Mlo,Mhi = 10,12
-            while Mlo<14:
-                Nstars = 0
-                for obj in res:
-                    srcid,ra,dec,pmra,pmdec,mag = obj
-                    if mag>=Mlo and mag<=Mhi:
-                        Nstars += 1
-                if Nstars<self.MINFOPS:
-                    Mlo += 0.25
-                    Mhi += 0.25
-                else:
-                    break
-            # For the unlikely event of not having enough stars
-            if Mlo>=14:
-                Mlo = 11.75
-                Mhi = 14
-                while Mlo>=10:
-                    Nstars = 0
-                    for obj in res:
-                        srcid,ra,dec,pmra,pmdec,mag = obj
-                        if mag>=Mlo and mag<=Mhi:
-                            Nstars += 1
-                    if Nstars<self.MINFOPS:
-                        Mlo -= 0.25
-                    else:
-                        break
+            Mlo,Mhi = self.getFOPSMagnitudeRange(mags)
         else:
             Mlo,Mhi = self.GAIA_RANGE
+        currentNames = set(catalog[oid]["name"] for oid in catalog.keys())
+        names = np.array(["NWHG "+str(srcid) for srcid in stars["source_id"]])
+        keep = (mags>=Mlo)&(mags<=Mhi)
+        keep &= np.array([name not in currentNames for name in names],dtype=bool)
+        stars,names,mags = stars[keep],names[keep],mags[keep]
+
+        ra,dec = self.propagateCoords(stars["ra"],stars["dec"],stars["pmra"],stars["pmdec"],2016.0)
+        # Round RA/Dec as they would be written to file to ensure saved
+        #  catalogs are the same coords
+        ra,dec,strRA,strDec = self.roundCoords(ra,dec)
+        xc,yc,xs,ys = self.skyToPlate(ra,dec)
+
         FOPS = {}
         objid = max(catalog)+1
-        correction = years*1e-3/3600
-        currentNames = [catalog[oid]["name"] for oid in catalog.keys()]
-        for obj in res:
-            srcid,ra,dec,pmra,pmdec,mag = obj
-            srcid = "NWHG "+str(srcid)
-            if srcid in currentNames:
-                continue
-            if mag<Mlo or mag>Mhi:
-                continue
-            cosDec = cos(dec*pi/180)
-            ra += (pmra/cosDec)*correction
-            dec += pmdec*correction
-            ra = float(ra)%360
-            dec = float(dec)
-            # Convert RA/Dec to string and back to ensure saved catalogs are the same coords
-            strRA = self.ra2str(ra)
-            strDec = self.dec2str(dec)
-            ra = self.str2deg(strRA)*15
-            dec = self.str2deg(strDec)
-            xc,yc,xs,ys = self.skyToPlate(ra,dec)
-            FOPS[objid] = {"name":"%s"%(srcid),
-                           "mag":"%5.2f"%(mag),
-                           "RADeg":ra,
-                           "DecDeg":dec,
+        for i,name in enumerate(names):
+            FOPS[objid] = {"name":"%s"%(name),
+                           "mag":"%5.2f"%(mags[i]),
+                           "RADeg":float(ra[i]),
+                           "DecDeg":float(dec[i]),
                            "type":'F',
                            "weight":self.FOPSWEIGHT,
-                           "ra":strRA,
-                           "dec":strDec,
+                           "ra":strRA[i],
+                           "dec":strDec[i],
                            "fibid":None,
                            "slitid":None,
-                           "x":xc,
-                           "y":yc}
+                           "x":float(xc[i]),
+                           "y":float(yc[i])}
             objid += 1
         return catalog|FOPS
 
+    def setPlatePositions(self,catalog):
+        """
+        Set the plate coordinates of all catalog objects with one call to
+          skyToPlate, first moving the objects to OBSDATE if the catalog
+          has proper motions.
+        """
+        objids = list(catalog.keys())
+        ra = np.array([catalog[objid]["RADeg"] for objid in objids])
+        dec = np.array([catalog[objid]["DecDeg"] for objid in objids])
+        if self.PMEPOCH is not None:
+            pmra = np.array([catalog[objid]["pmra"] for objid in objids])
+            pmdec = np.array([catalog[objid]["pmdec"] for objid in objids])
+            ra,dec = self.propagateCoords(ra,dec,pmra,pmdec,self.PMEPOCH)
+        xc,yc,xs,ys = self.skyToPlate(ra,dec)
+        for i,objid in enumerate(objids):
+            # FOPS are placed using the guide camera wavelength
+            if catalog[objid]["type"]=="F":
+                x,y = xc[i],yc[i]
+            else:
+                x,y = xs[i],ys[i]
+            catalog[objid]["x"] = float(x)
+            catalog[objid]["y"] = float(y)
+
+    def propagateCoords(self,ra,dec,pmra,pmdec,epoch):
+        """
+        Move RA/Dec (in degrees) from epoch to OBSDATE. Proper motions are in
+          mas/yr, and pmra includes the cos(Dec) term.
+        """
+        from astropy.time import Time
+        years = Time(self.DATE,format="datetime").decimalyear-epoch
+        correction = years*1e-3/3600
+        cosDec = np.cos(dec*pi/180)
+        ra = (ra+(pmra/cosDec)*correction)%360
+        dec = dec+pmdec*correction
+        return ra,dec
+
+    def getFOPSMagnitudeRange(self,mags):
+        """
+        Find the faintest 2mag window (stepping by 0.25mag from 10<G<12)
+          with at least MINFOPS stars. If there is no such window, widen
+          the window from 11.75<G<14 towards brighter stars instead.
+        """
+        mags = np.sort(mags)
+        def count(lo,hi):
+            return np.searchsorted(mags,hi,side="right")-np.searchsorted(mags,lo,side="left")
+        lo = 10+0.25*np.arange(16)
+        N = count(lo,lo+2)
+        if (N>=self.MINFOPS).any():
+            Mlo = lo[np.argmax(N>=self.MINFOPS)]
+            return float(Mlo),float(Mlo+2)
+        # For the unlikely event of not having enough stars
+        lo = 11.75-0.25*np.arange(8)
+        N = count(lo,14)
+        if (N>=self.MINFOPS).any():
+            return float(lo[np.argmax(N>=self.MINFOPS)]),14.
+        return 9.75,14.
+
+    def getGaiaStars(self,radius=0.5):
+        """
+        Get the Gaia stars within radius of the field center that satisfy
+          the BP-RP limits, preferably from the local catalog.
+        """
+        t = time.time()
+        local = LocalGaiaCatalog(self.gaiadir)
+        if local.covers(self.FIELDRA,self.FIELDDEC,radius):
+            stars = local.coneSearch(self.FIELDRA,self.FIELDDEC,radius)
+            # Mimic the ADQL limits below; NaN colors fail every comparison,
+            #  as NULLs do in the archive
+            color = stars["bp_rp"]
+            if self.BPRP_MAX is not None and self.BPRP_MIN is not None:
+                stars = stars[(color>=self.BPRP_MIN)&(color<=self.BPRP_MAX)]
+            elif self.BPRP_MAX is not None:
+                stars = stars[color<self.BPRP_MAX]
+            elif self.BPRP_MIN is not None:
+                stars = stars[color>self.BPRP_MIN]
+            self.printMessage("Obtained {} stars from the local Gaia catalog with G<14 in {:.2f}s".format(len(stars),time.time()-t))
+            return stars
+
+        cacheFile = self.getGaiaCacheFile(radius)
+        if os.path.isfile(cacheFile):
+            age = (time.time()-os.path.getmtime(cacheFile))/86400
+            if age<=self.getGaiaCacheTTL():
+                try:
+                    stars = np.load(cacheFile)
+                    self.printMessage("Gaia cache hit: {} stars with G<14 from a {:.1f} day old query".format(len(stars),age))
+                    return stars
+                except:
+                    self.printMessage("Gaia cache miss: could not read "+cacheFile)
+            else:
+                self.printMessage("Gaia cache miss: cached query has expired")
+        else:
+            self.printMessage("Gaia cache miss: querying the archive")
+
+        query = "SELECT %s from gaiadr3.gaia_source WHERE DISTANCE(%f,%f,ra,dec)<%f and pmra is not null and phot_g_mean_mag<14 and phot_g_mean_mag is not null"%(GAIA_COLUMNS,self.FIELDRA,self.FIELDDEC,radius)
+        if self.BPRP_MAX is not None and self.BPRP_MIN is not None:
+            query += " and ((phot_bp_mean_mag-phot_rp_mean_mag) between {} and {})".format(self.BPRP_MIN,self.BPRP_MAX)
+        elif self.BPRP_MAX is not None:
+            query += " and (phot_bp_mean_mag-phot_rp_mean_mag)<{}".format(self.BPRP_MAX)
+        elif self.BPRP_MIN is not None:
+            query += " and (phot_bp_mean_mag-phot_rp_mean_mag)>{}".format(self.BPRP_MIN)
+        try:
+            from astroquery.gaia import Gaia
+            job = Gaia.launch_job(query)
+            stars = tableToArray(job.get_results())
+            self.printMessage("Obtained {} stars from Gaia DR3 with G<14 in {:.2f}s".format(len(stars),time.time()-t))
+        except:
+            self.printError("Could not query the Gaia catalog; either the archive is temporarily down or there is a problem with internet access.")
+            # An expired query is better than no FOPS at all
+            if os.path.isfile(cacheFile):
+                try:
+                    stars = np.load(cacheFile)
+                    self.printMessage("Using the expired Gaia cache ({} stars)".format(len(stars)))
+                    return stars
+                except:
+                    pass
+            return None
+        try:
+            os.makedirs(os.path.dirname(cacheFile),exist_ok=True)
+            np.save(cacheFile,stars)
+        except:
+            self.printError("Could not write the Gaia cache file: "+cacheFile)
+        return stars
+
+    def getGaiaCacheTTL(self):
+        ttl = os.environ.get("NEWHYDRA_GAIA_CACHE_TTL")
+        if ttl is None:
+            return self.GAIA_CACHE_TTL
+        try:
+            return float(ttl)
+        except ValueError:
+            self.printError("Invalid NEWHYDRA_GAIA_CACHE_TTL ({}); using {} days.".format(ttl,self.GAIA_CACHE_TTL))
+            return self.GAIA_CACHE_TTL
+
+    def getGaiaCacheFile(self,radius):
+        """
+        Gaia query results are cached per field center, search radius and
+          BP-RP limits.
+        """
+        key = (self.FIELDRA,self.FIELDDEC,radius,self.BPRP_MIN,self.BPRP_MAX).__repr__()
+        key = hashlib.md5(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cachedir,"gaia",key+".npy")
+
     def setFieldData(self,fieldData):
         self.targetSignal.emit(fieldData)
 
     def applyCatalog(self,header,catalog):
-        # Grab an image, either from cache or download
-        imgFile = "{}/{}_{}.jpeg".format(self.cachedir,self.ra2str(self.FIELDRA).replace(" ",":"),self.dec2str(self.FIELDDEC).replace(" ",":"))
-        worker =  Worker(self.setImage,imgFile)
+        # Grab an image, from cached tiles or downloaded
+        worker =  Worker(self.setImage)
         self.threadPool.start(worker)
 
         # Setup the field
@@ -435,6 +561,7 @@ class CatalogManager:
 
         self.catalog = catalog
         self.header = header
+        self.cableSignal.emit(self.CABLE)
         self.cacheKey = self.getCacheKey()
         optFile = self.getOptFile(self.cacheKey)
         self.setupOpt(optFile)
@@ -450,18 +577,16 @@ class CatalogManager:
 
     def getCacheKey(self):
         # Create the cache key to see if we have a pickle'd matrix
-        # First, is the header the same?
-        hdrKey = [_ for _ in sorted(self.header.items())]
+        # First, is the header the same? The cable only sets the active
+        #   fibers, which are updated after loading (updateActiveFibers)
+        hdrKey = [_ for _ in sorted(self.header.items()) if _[0]!="CABLE"]
         # Second, is the catalog the same
         catKey = [(key,[(k,v) for k,v in sorted(obj.items()) if k not in ["fibid","slitid"]]) for key,obj in sorted(self.catalog.items())]
-        # Finally, are the fibers the same
-        fiberKey = [(key,obj["active"]) for key,obj in sorted(self.FiberDB.items())]
 
         # A unique identifier is the string representation of the
         #   combination of these
-        cacheText = (hdrKey+catKey+fiberKey).__repr__()
+        cacheText = (hdrKey+catKey).__repr__()
         # Convert the text to an MD5 hash to save space
-        import hashlib
         cacheKey = hashlib.md5(cacheText.encode("utf-8")).hexdigest()
         return cacheKey
 
@@ -491,8 +616,80 @@ class CatalogManager:
         '''
         Try to load cached collision matrix. If not loaded, recreate it.
         '''
+        if not self.loadOptFile(optFile):
+            self.setMatrix()
+            self.dumpOptFile(optFile)
+        elif self.updateActiveFibers():
+            # The cached matrix was made for other active fibers
+            self.dumpOptFile(optFile)
+        self.sharedPlacement = None
+        if self.ALLCABLES:
+            # The matrix is for both cables; keep it for switchCable()
+            self.shareActiveFibers()
+        self.resetOptLists()
+
+    def resetOptLists(self):
+        """
+        Sort the objects of each fiber by weight and start a new (empty)
+          configuration.
+        """
+        self.objListWeights = [[] for _ in self.fibers]
+        self.zeroCurrentConfig()
+        for fibId,objs in enumerate(self.objList):
+            wts = [self.weights[i] for i in objs]
+            args = sorted(range(len(wts)),key=wts.__getitem__,reverse=True)
+            self.objList[fibId] = [objs[i] for i in args]
+            self.objListWeights[fibId] = [wts[i] for i in args]
+            self.addToCurrentConfig(None,0.,False)
+
+    @profiled()
+    def switchCable(self,cable):
+        """
+        Use the other cable for the loaded field. The fibers of the cable are
+          made active and the placement is reset. The placement data is
+          derived from the data for both cables, which is made by the first
+          switch (or when the field is loaded, with ALLCABLES) and again if
+          the catalog has changed.
+        """
+        if self.catalog is None or cable==self.CABLE:
+            return
+        self.CABLE = cable
+        self.header["CABLE"] = cable
+        for fibid,data in self.FiberDB.items():
+            if data["cable"]!='F':
+                data["active"] = data["status"]=="A" and data["cable"]==cable[0]
+        self.resetActiveFibers(True)
+        self.cableSignal.emit(cable)
+        self.printMessage("Switched to the {} cable.".format(cable))
+
+    def resetActiveFibers(self,allCables=False):
+        """
+        Park all of the fibers and reset the placement for the active fibers
+          in FiberDB, using the shared data where possible. Otherwise the
+          placement data is updated for the active fibers or, with
+          allCables (or ALLCABLES), for both cables and then shared.
+        """
+        for fibid,data in self.FiberDB.items():
+            data["object"] = -1
+            data["x"] = data["xpark"]
+            data["y"] = data["ypark"]
+            data["parked"] = True
+            data["queued"] = False
+        if not self.selectActiveFibers():
+            if allCables or self.ALLCABLES:
+                self.updateActiveFibers(True)
+                self.shareActiveFibers()
+            else:
+                self.updateActiveFibers()
+        self.resetOptLists()
+        self.showSelected()
+
+    def toggleCable(self):
+        self.switchCable("BLUE" if self.CABLE=="RED" else "RED")
+
+    @profiled()
+    def loadOptFile(self,optFile):
         data = None
-        loaded = False
         if os.path.isfile(optFile):
             try:
                 with open(optFile,"rb") as F:
@@ -502,45 +699,28 @@ class CatalogManager:
         if data:
             try:
                 self.fiberLists,self.fiberGeometries,self.footprints,self.idmap,self.weights,self.fibers,self.parkedGeometries,self.objList,self.MATRIX,self.FOPSindex = data
-                loaded = True
+                return True
             except:
                 pass
-        if not loaded:
-            self.setMatrix()
-            self.dumpOptFile(optFile)
-
-        # Reset optimization lists
-        self.objListWeights = [[] for _ in self.fibers]
-        self.zeroCurrentConfig()
-        for fibId,objs in enumerate(self.objList):
-            wts = [self.weights[i] for i in objs]
-            args = sorted(range(len(wts)),key=wts.__getitem__,reverse=True)
-            self.objList[fibId] = [objs[i] for i in args]
-            self.objListWeights[fibId] = [wts[i] for i in args]
-            self.addToCurrentConfig(None,0.,False)
+        return False
 
+    @profiled()
     def dumpOptFile(self,optFile):
         with open(optFile,"wb") as F:
             pickle.dump([self.fiberLists,self.fiberGeometries,self.footprints,self.idmap,self.weights,self.fibers,self.parkedGeometries,self.objList,self.MATRIX,self.FOPSindex],F,2)
 
-    def setImage(self,imgFile):
-        img = None
-        if os.path.isfile(imgFile):
-            from PIL import Image
-            try:
-                img = Image.open(imgFile)
-            except:
-                pass
+    def setImage(self):
+        if self.imageService is None:
+            from .PS1helper import PS1ImageService
+            self.imageService = PS1ImageService(os.path.join(self.cachedir,"ps1"))
+        ra,dec = self.FIELDRA,self.FIELDDEC
+        def show(img):
+            # Don't show images for a field that is no longer loaded
+            if self.FIELDRA==ra and self.FIELDDEC==dec:
+                self.imageSignal.emit(img,-self.PA)
+        img = self.imageService.getImage(ra,dec,show)
         if img is None:
-            from .PS1helper import getPS1Image
-            self.printMessageSignal.emit("Downloading image")
-            img = getPS1Image(self.FIELDRA,self.FIELDDEC,0.,mode=3)
-            if img is not None:
-                img.save(imgFile)
-            else:
-                self.printMessageSignal.emit("Could not download the Pan-STARRS image.")
-        if img is not None:
-            self.imageSignal.emit(img,-self.PA)
+            self.printMessageSignal.emit("Could not download the Pan-STARRS image.")
 
     def addTarget(self,ra,dec,objid=None):
         raStr = self.ra2str(ra)
@@ -577,8 +757,10 @@ class CatalogManager:
             self.objList[fibId] = [objs[i] for i in args]
             self.objListWeights[fibId] = [wts[i] for i in args]
 
+        # The new object's geometry arrays are made once for all rows
+        geometries = self.getGeometryArray(optID)
         for i in range(len(self.MATRIX)):
-            self.MATRIX[i].append(self.getMatrixEntry(i,optID))
+            self.MATRIX[i].append(self.getMatrixEntry(i,optID,geometries))
         self.MATRIX.append(self.populateMatrixEntries(optID))
         self.updateFiberTable(self.catalog)
 
@@ -614,10 +796,17 @@ class CatalogManager:
             return
 
         for key in self.headerKeywords:
+            # Files without proper motions are written as before
+            if key=="PMEPOCH" and self.PMEPOCH is None:
+                continue
             F.write("{}: {}\n".format(key,self.header[key]))
         F.write("SCORE: %d\n"%(self.currentConfig.score))
         for objid,obj in self.catalog.items():
-            F.write("{:>4} {:>30} {:>5} {:>12} {:>12} {:>5} {}".format(objid,obj["name"],obj["mag"],obj["ra"],obj["dec"],obj["weight"],obj["type"]))
+            F.write("{:>4} {:>30} {:>5} {:>12} {:>12} {:>5} ".format(objid,obj["name"],obj["mag"],obj["ra"],obj["dec"],obj["weight"]))
+            if self.PMEPOCH is not None:
+                # FOPS and added sky positions are already at OBSDATE
+                F.write("{:>8.2f} {:>8.2f} ".format(obj.get("pmra",0.),obj.get("pmdec",0.)))
+            F.write(obj["type"])
             if obj["fibid"]:
                 F.write(" {:>3}".format(obj["fibid"]))
                 if self.FiberDB[str(obj["fibid"])]["queued"]:
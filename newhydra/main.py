@@ -1,4 +1,7 @@
-import sys,os
+import sys,os,time
+# Time taken to import the modules below is part of the startup report
+IMPORT_START = time.perf_counter()
+import numpy as np
 try:
     import importlib_resources
 except ImportError:
@@ -24,12 +27,18 @@ from .astrometry import Astrometry
 from .collision import CollisionMatrix
 from .configuration import Configuration
 from .placer import FiberPlacer
+from .gaiacatalog import getGaiaDir
+from .startup import getProfile
+from . import profiling
+IMPORT_TIME = time.perf_counter()-IMPORT_START
 
 
 
 class Window(QMainWindow, Ui_MainWindow,CatalogManager,UpdateHandler,FiberInitializer,Astrometry,CollisionMatrix,Configuration,FiberPlacer):
 
     def __init__(self,parent=None):
+        self.startupTimes = [("imports",IMPORT_TIME)]
+        self.startupClock = time.perf_counter()
         super().__init__(parent)
         self.threadPool = QThreadPool()
 
@@ -40,6 +49,11 @@ class Window(QMainWindow, Ui_MainWindow,CatalogManager,UpdateHandler,FiberInitia
         # Make the cache if necessary
         self.cachedir = user_cache_dir("newhydra")
         os.makedirs(self.cachedir,exist_ok=True)
+        # Location of the (optional) local Gaia catalog
+        self.gaiadir = getGaiaDir()
+        # Pan-STARRS images are built from tiles cached here; the service is
+        #  created when the first image is needed
+        self.imageService = None
 
         self.fieldinfo.setStyleSheet("background-color: rgba(255,255,255,0.5); border-radius: 4px;")
         self.fieldname_label.setStyleSheet("background-color: rgba(255,255,255,0.5)")
@@ -47,6 +61,7 @@ class Window(QMainWindow, Ui_MainWindow,CatalogManager,UpdateHandler,FiberInitia
         self.showmarkers.setStyleSheet("background-color: rgba(255,255,255,0.4); border-radius: 4px;")
         self.fieldinfo.hide()
         self.showmarkers.hide()
+        self.cable_btn.hide()
 
         self.fiberCountTable.setSpan(0,0,1,2)
         self.fiberCountTable.setStyleSheet("""
@@ -73,6 +88,7 @@ class Window(QMainWindow, Ui_MainWindow,CatalogManager,UpdateHandler,FiberInitia
         self.printMessageSignal.connect(self.printMessage)
         self.fiberSignal.connect(self.updateFiberStatus)
         self.targetSignal.connect(self.updateFieldInfo)
+        self.cableSignal.connect(self.updateCable)
         self.imageSignal.connect(self.setImageDirect)
 
         configFileData = importlib_resources.files('newhydra').joinpath('data/hydraConfig.json')
@@ -80,10 +96,14 @@ class Window(QMainWindow, Ui_MainWindow,CatalogManager,UpdateHandler,FiberInitia
         self.sitePars = self.HydraConfig["WIYN"]
         self.setButtons()
 
+        self.markStartup("ui")
+
         self.getConcentricities()
+        self.markStartup("concentricities")
         self.DisplayManager = FiberDisplayManager(self)
 
         self.DisplayManager.updateFiberDB(self.FiberDB)
+        self.markStartup("display")
 
         self.setupTable()
         self.loadField_btn.clicked.connect(self.loadFieldFile)
@@ -97,14 +117,54 @@ class Window(QMainWindow, Ui_MainWindow,CatalogManager,UpdateHandler,FiberInitia
         self.reset_btn.clicked.connect(self.resetPopup)
 
         self.showUnassigned_btn.clicked.connect(self.DisplayManager.startUnassignedBlink)
+        # Switch the loaded field between the red and blue cables
+        self.cable_btn.clicked.connect(self.toggleCable)
 
         self.messageBox.setStyleSheet("font: 9pt 'Courier';")
 
+        # Check for a newer concentricities file without holding up the UI
+        self.refreshConcentricities()
+        self.reportStartup()
+
 
         # We place the prompt() call behind a QTimer to give the
         #  GUI a chance to come up before the OpenFile dialog
         QTimer.singleShot(50,self.prompt)
 
+    def markStartup(self,phase):
+        now = time.perf_counter()
+        self.startupTimes.append((phase,now-self.startupClock))
+        self.startupClock = now
+
+    def reportStartup(self):
+        total = sum(dt for _,dt in self.startupTimes)
+        phases = ", ".join("{} {:.2f}s".format(phase,dt) for phase,dt in self.startupTimes)
+        self.printMessage("Started in {:.2f}s ({})".format(total,phases))
+        self.writeStartupProfile()
+
+    def writeStartupProfile(self,phase=None,dt=None):
+        """
+        Write the startup profile if profiling was requested (see startup.py);
+          the time taken to load the first field is added once it is known.
+        """
+        profile = getProfile()
+        if profile is None:
+            return
+        for name,t in self.startupTimes:
+            profile.addPhase(name,t)
+        if phase is not None:
+            if phase in dict(profile.phases):
+                return
+            profile.addPhase(phase,dt)
+        profile.write()
+
+    def reportProfile(self):
+        """
+        Show the pipeline stage timings if profiling is on (see profiling.py).
+        """
+        for line in profiling.summary():
+            self.printMessage(line)
+
     def prompt(self):
         if len(sys.argv)>1:
             self.loadFieldFile(filename=sys.argv[1])
@@ -218,6 +278,29 @@ class Window(QMainWindow, Ui_MainWindow,CatalogManager,UpdateHandler,FiberInitia
         s = ((dec-d)*60-m)*60
         return "%s%02d%s%02d%s%05.2f"%(sign,d,sep,m,sep,s)
 
+    def roundCoords(self,ra,dec):
+        """
+        Array equivalent of converting RA/Dec (in degrees) to strings with
+          ra2str/dec2str and back with str2deg. Returns the rounded RA/Dec
+          arrays and the lists of strings.
+        """
+        H = np.asarray(ra,dtype=float)/15.
+        h = np.trunc(H)
+        m = np.trunc((H-h)*60)
+        s = np.round(((H-h)*60-m)*60,3)
+        raOut = (h+m/60+s/3600)*15
+        raStr = ["%02d %02d %06.3f"%(_h,_m,_s) for _h,_m,_s in zip(h,m,s)]
+
+        dec = np.asarray(dec,dtype=float)
+        sign = np.where(dec>=0,1,-1)
+        D = np.abs(dec)
+        d = np.trunc(D)
+        m = np.trunc((D-d)*60)
+        s = np.round(((D-d)*60-m)*60,2)
+        decOut = sign*(d+m/60+s/3600)
+        decStr = ["%s%02d %02d %05.2f"%("+" if _sign>0 else "-",_d,_m,_s) for _sign,_d,_m,_s in zip(sign,d,m,s)]
+        return raOut,decOut,raStr,decStr
+
     @pyqtSlot(str)
     def printMessage(self,*kargs):
         message = " ".join(kargs)
@@ -237,6 +320,8 @@ class Window(QMainWindow, Ui_MainWindow,CatalogManager,UpdateHandler,FiberInitia
 def main():
     app = QApplication(sys.argv)
     win = Window()
+    # Stop the worker processes (if they were started) before exiting
+    app.aboutToQuit.connect(win.stopWorkerPool)
     win.show()
     sys.exit(app.exec())
 
@@ -1,9 +1,11 @@
 import random
 import time
+import os
 from math import cos,sin,pi,atan2,sqrt,log
 from PyQt6.QtCore import Qt,pyqtSlot,pyqtSignal
-import shapely
 from .worker import Worker
+from .profiling import profiled
+from .telemetry import OptimizerTelemetry,ACCEPTED,REJECTED,BLOCKED,NOMOVE
 
 class FiberPlacer:
 
@@ -13,6 +15,11 @@ class FiberPlacer:
     INITIALIZING = True
     NFOPS = 0
     bestID = []
+    # Per-step telemetry of the optimizer is only kept if it is written to
+    #  a file; otherwise just the step outcomes are counted
+    TELEMETRYFILE = os.environ.get("NEWHYDRA_OPT_TELEMETRY")
+    telemetry = None
+    outcomes = None
 
     def checkCollision(self,fibIndex,optID,fibIndex2,optID2):
         """
@@ -95,29 +102,47 @@ class FiberPlacer:
         tmpNFOPS = self.NFOPS
         # Draw the fiber to assign
         fibIndex = random.choice([index for index,flag in self.iterateCurrentFlags() if flag!=1])
+        telemetry = self.telemetry
         # Sometimes a fiber won't have any objects associated with it...
         if len(self.objList[fibIndex])==0:
+            self.outcomes[NOMOVE] += 1
+            if telemetry is not None:
+                telemetry.record(iteration,T,NOMOVE,0,0.,0.,self.currentConfig.score,self.bestConfig.score)
             return
         # Draw the object to assign the fiber to; weight objects based upon
         #  their provided weights
         optID = random.choices(self.objList[fibIndex],self.objListWeights[fibIndex])[0]
+        if telemetry is not None:
+            t0 = time.perf_counter()
         removed = self.addObjectToConfiguration(fibIndex,optID,forceCode=1)
+        if telemetry is not None:
+            t1 = time.perf_counter()
         if removed is None:
             # If removed is none we've collided with a manually placed fiber
             self.restoreCurrentConfig(originalConfig)
             self.NFOPS = tmpNFOPS
             # We've collided with a manually placed fiber
+            self.outcomes[BLOCKED] += 1
+            if telemetry is not None:
+                telemetry.record(iteration,T,BLOCKED,0,t1-t0,0.,self.currentConfig.score,self.bestConfig.score)
             return
         for r in removed:
             self.selectObjectForFiber(r)
+        if telemetry is not None:
+            t2 = time.perf_counter()
 
         ratio = self.currentConfig.score-originalConfig.score#score-newScore#sum(self.selectedWeight)-sum(tmpWeights)
         if ratio>=0 or ratio/T>log(random.random()):
+            outcome = ACCEPTED
             if self.currentConfig.score>self.bestConfig.score:
                 self.bestConfig = self.copyCurrentConfig()
         else: # The move was *not* selected, so return to original state
+            outcome = REJECTED
             self.restoreCurrentConfig(originalConfig)
             self.NFOPS = tmpNFOPS
+        self.outcomes[outcome] += 1
+        if telemetry is not None:
+            telemetry.record(iteration,T,outcome,len(removed),t1-t0,t2-t1,self.currentConfig.score,self.bestConfig.score)
 
     def optimize(self):
         worker = Worker(self.doOptimize)
@@ -132,10 +157,15 @@ class FiberPlacer:
         self.updateScoreSignal.disconnect(myWindow.updateScoreLabel)
         time.sleep(0.1)
         self.showSelected()#self.selectedID)
+        self.reportTelemetry()
+        self.reportProfile()
 
+    @profiled()
     def doOptimize(self,nsteps=20000):
         # First reset all of the objects except manually selected fibers
         self.bestConfig = self.copyCurrentConfig()
+        self.telemetry = OptimizerTelemetry() if self.TELEMETRYFILE else None
+        self.outcomes = [0,0,0,0]
 
         self.NFOPS = 0
         for index,flag in self.iterateCurrentFlags():
@@ -163,6 +193,8 @@ class FiberPlacer:
         self.T0 = 0.
         self.MAX = nsteps
         self.nonlin = 2.
+        if self.telemetry is not None:
+            self.telemetry.setSchedule(self.T1,self.T0,self.nonlin,0,self.MAX)
 
         NTOT = self.MAX*1.5
         NCOUNT = 0
@@ -183,6 +215,8 @@ class FiberPlacer:
         self.T1 = 100
         self.T0 = 50
         self.nonlin = 4
+        if self.telemetry is not None:
+            self.telemetry.setSchedule(self.T1,self.T0,self.nonlin,self.MAX//2,self.MAX)
 
         tlast = time.time()
         for i in range(self.MAX//2,self.MAX):
@@ -199,6 +233,32 @@ class FiberPlacer:
         self.restoreCurrentConfig(self.bestConfig)
         self.updateOptProgressSignal.emit(100)
 
+    def reportTelemetry(self):
+        """
+        Summarize the last optimizer run, and export (or plot, for .png/.pdf
+          files) the telemetry to the file named by NEWHYDRA_OPT_TELEMETRY.
+        """
+        if self.outcomes is None:
+            return
+        if self.telemetry is None:
+            moves = self.outcomes[ACCEPTED]+self.outcomes[REJECTED]
+            if moves:
+                self.printMessage("Optimizer: {} steps, {:.0f}% accepted".format(sum(self.outcomes),100*self.outcomes[ACCEPTED]/moves))
+            return
+        S = self.telemetry.summary()
+        if S["acceptance"] is not None:
+            self.printMessage("Optimizer: {} steps, {:.0f}% accepted, {:.2f} fibers removed per move, {:.2f}s adding/{:.2f}s reselecting".format(S["steps"],100*S["acceptance"],S["meanRemoved"],S["addTime"],S["selectTime"]))
+        filename = self.TELEMETRYFILE
+        try:
+            if os.path.splitext(filename)[1].lower() in (".png",".pdf"):
+                self.telemetry.plot(filename)
+            else:
+                self.telemetry.export(filename)
+            self.printMessage("Wrote the optimizer telemetry to "+filename)
+        except Exception as err:
+            self.printError("Could not write the optimizer telemetry: {}".format(err))
+
+    @profiled()
     def showSelected(self):
         selected = self.currentConfig.IDs
         self.updateBestConfig()
@@ -207,21 +267,22 @@ class FiberPlacer:
             self.catalog[objid]["fibid"] = None
             self.catalog[objid]["slitid"] = None
 
+        # Work out the final state of every fiber before updating the display
+        #  so that each fiber is only redrawn once
+        assigned = {}
+        for fibIndex,optID in enumerate(selected):
+            if optID is not None:
+                assigned[self.fibers[fibIndex]] = (fibIndex,self.idmap[optID])
         for fibID in self.fibers:
             sfibID = str(fibID)
-            self.FiberDB[sfibID]["object"] = -1
-            self.FiberDB[sfibID]["x"] = self.FiberDB[sfibID]["xpark"]
-            self.FiberDB[sfibID]["y"] = self.FiberDB[sfibID]["ypark"]
-            self.FiberDB[sfibID]["parked"] = True
-            self.FiberDB[sfibID]["queued"] = False
-        self.updateFiberStatus(self.FiberDB)
-
-        for fibIndex,optID in enumerate(selected):
-            if optID is None:
+            if fibID not in assigned:
+                self.FiberDB[sfibID]["object"] = -1
+                self.FiberDB[sfibID]["x"] = self.FiberDB[sfibID]["xpark"]
+                self.FiberDB[sfibID]["y"] = self.FiberDB[sfibID]["ypark"]
+                self.FiberDB[sfibID]["parked"] = True
+                self.FiberDB[sfibID]["queued"] = False
                 continue
-            fibID = self.fibers[fibIndex]
-            objID = self.idmap[optID]
-            sfibID = str(fibID)
+            fibIndex,objID = assigned[fibID]
             self.FiberDB[sfibID]["object"] = objID
             self.FiberDB[sfibID]["x"] = self.catalog[objID]["x"]
             self.FiberDB[sfibID]["y"] = self.catalog[objID]["y"]
@@ -0,0 +1,190 @@
+"""
+Timing of the placement pipeline stages.
+
+Profiling is switched on by setting the NEWHYDRA_PROFILE environment variable
+  before NeWHydra starts:
+
+    NEWHYDRA_PROFILE=1        wall and CPU time and call counts per stage
+    NEWHYDRA_PROFILE=memory   also the peak (Python) memory of each stage;
+                              tracemalloc slows everything down
+    NEWHYDRA_PROFILE_TRACE    also write a Chrome trace (chrome://tracing or
+                              https://ui.perfetto.dev) to this file on exit
+
+Stages are marked with the @profiled decorator or, for parts of a function,
+  the stage() context manager. When profiling is off the decorator returns
+  the function itself, so there is no overhead at all.
+
+The CPU time is that of the thread running the stage; the worker processes
+  (eg, of createMatrix) are not included. tracemalloc only has one peak for
+  the whole process, so the memory peak is only measured for stages that
+  start when no other stage is running; it is not shown for nested stages
+  or stages that overlap another (eg, in a Worker thread). The trace keeps
+  the most recent MAXEVENTS stages.
+"""
+import os,time,threading,atexit,json
+from collections import deque
+from functools import wraps
+
+MODE = os.environ.get("NEWHYDRA_PROFILE","0")
+TRACEFILE = os.environ.get("NEWHYDRA_PROFILE_TRACE")
+ENABLED = MODE!="0" or TRACEFILE is not None
+MEMORY = MODE=="memory"
+MAXEVENTS = 100000
+
+
+class StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.
+        self.cpu = 0.
+        self.peak = None
+
+
+class Registry:
+    """
+    Statistics per stage and the list of trace events. Stages may be nested
+      and run from several threads; each thread keeps its own stack.
+    """
+    def __init__(self):
+        self.stats = {}
+        self.events = deque(maxlen=MAXEVENTS)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # The number of stages running, in any thread
+        self.running = 0
+        self.origin = time.perf_counter()
+        if MEMORY:
+            import tracemalloc
+            tracemalloc.start()
+
+    def getStack(self):
+        if not hasattr(self.local,"stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def enter(self,name):
+        stack = self.getStack()
+        with self.lock:
+            self.running += 1
+            tracked = MEMORY and self.running==1
+        if tracked:
+            import tracemalloc
+            tracemalloc.reset_peak()
+        stack.append([name,time.perf_counter(),time.thread_time(),tracked])
+
+    def exit(self):
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        stack = self.getStack()
+        name,start,cpuStart,tracked = stack.pop()
+        peak = None
+        if tracked:
+            import tracemalloc
+            peak = tracemalloc.get_traced_memory()[1]
+        with self.lock:
+            self.running -= 1
+            stats = self.stats.setdefault(name,StageStats())
+            stats.calls += 1
+            stats.wall += wall-start
+            stats.cpu += cpu-cpuStart
+            if peak is not None:
+                stats.peak = max(stats.peak or 0,peak)
+            self.events.append({"name":name,
+                                "ph":"X",
+                                "ts":(start-self.origin)*1e6,
+                                "dur":(wall-start)*1e6,
+                                "pid":os.getpid(),
+                                "tid":threading.get_ident(),
+                                "args":{"cpu_ms":(cpu-cpuStart)*1e3,"peak_bytes":peak}})
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+            self.events.clear()
+
+    def summary(self):
+        """
+        Lines of a table of the stage statistics, in the order the stages
+          were first completed.
+        """
+        lines = ["{:18s} {:>5s} {:>8s} {:>8s}".format("stage","calls","wall","cpu*")]
+        if MEMORY:
+            lines[0] += " {:>8s}".format("peak")
+        with self.lock:
+            items = list(self.stats.items())
+        for name,stats in items:
+            line = "{:18s} {:5d} {:7.2f}s {:7.2f}s".format(name[:18],stats.calls,stats.wall,stats.cpu)
+            if MEMORY:
+                line += " {:6.1f}MB".format(stats.peak/2**20) if stats.peak is not None else " {:>8s}".format("-")
+            lines.append(line)
+        lines.append("* CPU time of the calling thread only, not the worker processes")
+        return lines
+
+    def exportChromeTrace(self,filename):
+        with self.lock:
+            events = list(self.events)
+        with open(filename,'w') as F:
+            json.dump({"traceEvents":events,"displayTimeUnit":"ms"},F)
+
+
+REGISTRY = Registry() if ENABLED else None
+
+
+class Stage:
+    def __init__(self,name):
+        self.name = name
+    def __enter__(self):
+        REGISTRY.enter(self.name)
+        return self
+    def __exit__(self,*args):
+        REGISTRY.exit()
+        return False
+
+
+class NullStage:
+    def __enter__(self):
+        return self
+    def __exit__(self,*args):
+        return False
+
+NULLSTAGE = NullStage()
+
+
+def stage(name):
+    """
+    Context manager timing the enclosed block as the stage `name'.
+    """
+    if REGISTRY is None:
+        return NULLSTAGE
+    return Stage(name)
+
+def profiled(name=None):
+    """
+    Decorator timing each call of a function as a stage, named after the
+      function by default.
+    """
+    def decorator(func):
+        if REGISTRY is None:
+            return func
+        stageName = name or func.__name__
+        @wraps(func)
+        def wrapper(*args,**kargs):
+            REGISTRY.enter(stageName)
+            try:
+                return func(*args,**kargs)
+            finally:
+                REGISTRY.exit()
+        return wrapper
+    return decorator
+
+def summary():
+    if REGISTRY is None:
+        return []
+    return REGISTRY.summary()
+
+def exportChromeTrace(filename):
+    if REGISTRY is not None:
+        REGISTRY.exportChromeTrace(filename)
+
+if TRACEFILE is not None:
+    atexit.register(exportChromeTrace,TRACEFILE)
@@ -0,0 +1,139 @@
+"""
+Startup profiling.
+
+Set NEWHYDRA_PROFILE_STARTUP to a filename (or pass --profile-startup[=FILE]
+  on the command line) and NeWHydra records how long every module takes to
+  import along with the startup phases of the main window (UI load,
+  concentricities, display initialization, and parsing the first field).
+  The results are written as JSON, by default to newhydra_startup.json in
+  the cache directory. benchmarks/startup.py uses this to track startup
+  times between releases.
+"""
+import sys,os,time,json
+
+ENV_VARIABLE = "NEWHYDRA_PROFILE_STARTUP"
+FLAG = "--profile-startup"
+DEFAULT_FILENAME = "newhydra_startup.json"
+
+PROFILE = None
+
+
+class ImportTimer:
+    """
+    Meta path finder that times the execution of every module imported while
+      it is installed. It only wraps the exec_module method of each module's
+      loader, so import semantics are unchanged. The self time of a module
+      excludes the time spent importing the modules that it imports.
+    """
+    def __init__(self):
+        self.stack = []
+        self.imports = []
+
+    def find_spec(self,name,path=None,target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder,"find_spec"):
+                continue
+            spec = finder.find_spec(name,path,target)
+            if spec is None:
+                continue
+            # Builtin and frozen importers are used as (shared) classes
+            loader = spec.loader
+            if loader is not None and not isinstance(loader,type) and hasattr(loader,"exec_module"):
+                loader.exec_module = self.timeModule(name,loader.exec_module)
+            return spec
+        return None
+
+    def timeModule(self,name,execModule):
+        def timedExecModule(module):
+            self.stack.append(0.)
+            start = time.perf_counter()
+            try:
+                return execModule(module)
+            finally:
+                elapsed = time.perf_counter()-start
+                children = self.stack.pop()
+                if self.stack:
+                    self.stack[-1] += elapsed
+                self.imports.append({"module":name,
+                                     "cumulative":elapsed,
+                                     "self":elapsed-children})
+        return timedExecModule
+
+
+class StartupProfile:
+    def __init__(self,filename):
+        self.filename = filename
+        self.start = time.perf_counter()
+        self.timer = ImportTimer()
+        self.phases = []
+
+    def install(self):
+        sys.meta_path.insert(0,self.timer)
+
+    def uninstall(self):
+        if self.timer in sys.meta_path:
+            sys.meta_path.remove(self.timer)
+
+    def addPhase(self,phase,dt):
+        self.phases = [_ for _ in self.phases if _[0]!=phase]+[(phase,dt)]
+
+    def getReport(self):
+        imports = sorted(self.timer.imports,key=lambda _:_["cumulative"],reverse=True)
+        # The self times add up to the total time spent importing
+        top = sum(_["self"] for _ in self.timer.imports)
+        try:
+            from importlib.metadata import version
+            release = version("newhydra")
+        except:
+            release = None
+        return {"version":release,
+                "python":sys.version.split()[0],
+                "platform":sys.platform,
+                "time":time.time(),
+                "imports_total":top,
+                "phases":dict(self.phases),
+                "imports":imports}
+
+    def write(self):
+        try:
+            dirname = os.path.dirname(self.filename)
+            if dirname:
+                os.makedirs(dirname,exist_ok=True)
+            with open(self.filename,'w') as F:
+                json.dump(self.getReport(),F,indent=1)
+        except Exception as err:
+            print("Could not write the startup profile to {}: {}".format(self.filename,err))
+
+
+def getFilename(argv):
+    """
+    Return the profile filename (or None if profiling is not requested),
+      removing the command line flag from argv so that it isn't taken as
+      the field file.
+    """
+    filename = os.environ.get(ENV_VARIABLE)
+    for arg in argv[1:]:
+        if arg==FLAG or arg.startswith(FLAG+"="):
+            argv.remove(arg)
+            filename = arg.partition("=")[2] or filename or ""
+            break
+    if filename is None:
+        return None
+    if filename in ("","1"):
+        from platformdirs import user_cache_dir
+        filename = os.path.join(user_cache_dir("newhydra"),DEFAULT_FILENAME)
+    return filename
+
+def enable(argv=None):
+    global PROFILE
+    if PROFILE is not None:
+        return PROFILE
+    filename = getFilename(sys.argv if argv is None else argv)
+    if filename is None:
+        return None
+    PROFILE = StartupProfile(filename)
+    PROFILE.install()
+    return PROFILE
+
+def getProfile():
+    return PROFILE
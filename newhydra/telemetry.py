@@ -0,0 +1,147 @@
+"""
+Telemetry of the annealing optimizer.
+
+With NEWHYDRA_OPT_TELEMETRY set to a file name, every annealing step is
+  recorded in a ring buffer (the most recent steps are kept) so that the
+  temperature schedule (T1, T0, nonlin) and the number of steps can be
+  tuned; otherwise the optimizer only counts the step outcomes. After a
+  run the telemetry can be summarized, exported as JSON or plotted (the
+  latter needs matplotlib).
+"""
+from collections import deque
+import json
+
+# Step outcomes
+ACCEPTED = 0
+REJECTED = 1
+BLOCKED = 2     # the move collided with a manually assigned fiber
+NOMOVE = 3      # the fiber has no objects
+OUTCOMES = ("accepted","rejected","blocked","nomove")
+
+FIELDS = ("iteration","temperature","outcome","removed","addTime","selectTime","score","best")
+
+
+class OptimizerTelemetry:
+    SIZE = 100000
+
+    def __init__(self,size=None):
+        self.steps = deque(maxlen=size or self.SIZE)
+        self.schedule = []
+        self.nsteps = 0
+
+    def setSchedule(self,T1,T0,nonlin,first,last):
+        """
+        Record a temperature schedule and the iterations it is used for.
+        """
+        self.schedule.append({"T1":T1,"T0":T0,"nonlin":nonlin,"first":first,"last":last})
+
+    def record(self,iteration,temperature,outcome,removed,addTime,selectTime,score,best):
+        self.nsteps += 1
+        self.steps.append((iteration,temperature,outcome,removed,addTime,selectTime,score,best))
+
+    def getColumn(self,field):
+        index = FIELDS.index(field)
+        return [step[index] for step in self.steps]
+
+    def acceptanceRates(self,nbuckets=10):
+        """
+        Acceptance rate of the moves that were evaluated, in temperature
+          buckets; returns a list of (Tlo,Thi,nmoves,rate).
+        """
+        T = self.getColumn("temperature")
+        if len(T)==0:
+            return []
+        Tlo,Thi = min(T),max(T)
+        width = (Thi-Tlo)/nbuckets or 1.
+        counts = [[0,0] for _ in range(nbuckets)]
+        for _,temperature,outcome,*_ in self.steps:
+            if outcome not in (ACCEPTED,REJECTED):
+                continue
+            bucket = min(int((temperature-Tlo)/width),nbuckets-1)
+            counts[bucket][0] += 1
+            counts[bucket][1] += outcome==ACCEPTED
+        rates = []
+        for i,(N,accepted) in enumerate(counts):
+            rates.append((Tlo+i*width,Tlo+(i+1)*width,N,accepted/N if N else None))
+        return rates
+
+    def bestTrajectory(self,npoints=100):
+        """
+        The best score, sampled at (up to) npoints steps.
+        """
+        N = len(self.steps)
+        if N==0:
+            return []
+        stride = max(1,N//npoints)
+        trajectory = [(self.steps[i][0],self.steps[i][7]) for i in range(0,N,stride)]
+        if (N-1)%stride:
+            trajectory.append((self.steps[-1][0],self.steps[-1][7]))
+        return trajectory
+
+    def summary(self):
+        outcomes = [0]*len(OUTCOMES)
+        removed = 0
+        moves = 0
+        addTime = 0.
+        selectTime = 0.
+        for step in self.steps:
+            outcomes[step[2]] += 1
+            addTime += step[4]
+            selectTime += step[5]
+            if step[2] in (ACCEPTED,REJECTED):
+                moves += 1
+                removed += step[3]
+        return {"steps":self.nsteps,
+                "recorded":len(self.steps),
+                "outcomes":dict(zip(OUTCOMES,outcomes)),
+                "acceptance":outcomes[ACCEPTED]/moves if moves else None,
+                "meanRemoved":removed/moves if moves else None,
+                "addTime":addTime,
+                "selectTime":selectTime,
+                "acceptanceRates":self.acceptanceRates(),
+                "bestTrajectory":self.bestTrajectory(),
+                "schedule":self.schedule}
+
+    def export(self,filename):
+        """
+        Write the summary and the recorded steps as JSON.
+        """
+        with open(filename,'w') as F:
+            json.dump({"summary":self.summary(),
+                       "fields":FIELDS,
+                       "steps":list(self.steps)},F)
+
+    def plot(self,filename):
+        """
+        Plot the score and best score, the temperature and the acceptance rate
+          (over a running window) against iteration.
+        """
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        steps = list(self.steps)
+        count = range(len(steps))
+        window = max(1,len(steps)//100)
+        accepted = [1. if step[2]==ACCEPTED else 0. for step in steps]
+        evaluated = [1. if step[2] in (ACCEPTED,REJECTED) else 0. for step in steps]
+        rate = []
+        nacc = neval = 0.
+        for i in count:
+            nacc += accepted[i]
+            neval += evaluated[i]
+            if i>=window:
+                nacc -= accepted[i-window]
+                neval -= evaluated[i-window]
+            rate.append(nacc/neval if neval else float("nan"))
+
+        fig,axes = plt.subplots(3,1,sharex=True,figsize=(8,8))
+        axes[0].plot(count,[step[6] for step in steps],lw=0.5,label="score")
+        axes[0].plot(count,[step[7] for step in steps],label="best")
+        axes[0].legend()
+        axes[1].plot(count,[step[1] for step in steps])
+        axes[1].set_ylabel("temperature")
+        axes[2].plot(count,rate)
+        axes[2].set_ylabel("acceptance")
+        axes[2].set_xlabel("step")
+        fig.savefig(filename)
+        plt.close(fig)
@@ -0,0 +1,99 @@
+"""
+A process pool shared by the batch jobs (eg, the collision matrix).
+
+The pool is started the first time it is needed and is kept until NeWHydra
+  exits, so the worker processes are only started once. They are started
+  with `forkserver' (or `spawn') rather than forked from the Qt process, and
+  are set up once by an initializer with the static configuration. The data
+  of a job, eg the fiber geometries of a field, is written to a file and
+  each worker loads it the first time it sees the job's token, instead of
+  the data being sent with every task.
+"""
+import os,pickle,tempfile,threading,atexit,itertools
+from multiprocessing import get_context,get_all_start_methods,cpu_count
+
+START_METHOD = "forkserver" if "forkserver" in get_all_start_methods() else "spawn"
+
+# The job data last loaded by this worker, as [token,data]
+JOB = [None,None]
+TOKENS = itertools.count()
+
+
+def defaultProcesses():
+    """
+    Leave two CPUs for NeWHydra and the rest of the system, up to 8 workers.
+    """
+    ncpu = cpu_count()
+    if ncpu<=2:
+        return 1
+    return min(ncpu-2,8)
+
+def loadJobData(token):
+    if token is None:
+        return None
+    if JOB[0]!=token:
+        # Drop the previous job's data first
+        JOB[0] = JOB[1] = None
+        with open(token[1],"rb") as F:
+            JOB[1] = pickle.load(F)
+        JOB[0] = token
+    return JOB[1]
+
+def runTask(args):
+    func,token,item = args
+    return func((item,loadJobData(token)))
+
+
+class WorkerPool:
+    """
+    A lazily started multiprocessing pool; initializer(*initargs) is run
+      in each worker when it starts.
+    """
+    def __init__(self,initializer=None,initargs=(),processes=None):
+        self.initializer = initializer
+        self.initargs = initargs
+        self.processes = processes or defaultProcesses()
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the workers if necessary. The workers come up in the
+          background, so this can be called early to hide their startup.
+        """
+        with self.lock:
+            if self.pool is None:
+                self.pool = get_context(START_METHOD).Pool(self.processes,self.initializer,self.initargs)
+                atexit.register(self.shutdown)
+            return self.pool
+
+    def imap(self,func,items,data=None,chunksize=1):
+        """
+        Yield func((item,data)) for each item, in order. The data is shared
+          by all of the tasks and is only loaded once by each worker.
+        """
+        pool = self.start()
+        token = None
+        if data is not None:
+            fd,filename = tempfile.mkstemp(prefix="newhydra-job-",suffix=".pkl")
+            with os.fdopen(fd,"wb") as F:
+                pickle.dump(data,F,pickle.HIGHEST_PROTOCOL)
+            token = (next(TOKENS),filename)
+        try:
+            for result in pool.imap(runTask,((func,token,item) for item in items),chunksize):
+                yield result
+        finally:
+            if token is not None:
+                os.remove(token[1])
+
+    def shutdown(self):
+        """
+        Stop the workers once they have finished their tasks.
+        """
+        with self.lock:
+            pool = self.pool
+            self.pool = None
+        if pool is not None:
+            atexit.unregister(self.shutdown)
+            pool.close()
+            pool.join()